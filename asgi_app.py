@@ -0,0 +1,277 @@
+"""ASGI entry point: async /predict_soil and /predict in front of the Flask app.
+
+    uvicorn asgi_app:app --workers 2
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi_app:app
+
+Request bodies are received on the event loop, so a slow upload holds no
+thread while it trickles in. POST /predict_soil and POST /predict are
+handled here: inference runs on a thread pool of SOIL_ASGI_INFERENCE_THREADS,
+and user lookups run on a separate pool sized like the database pool, so a
+slow database cannot starve inference and neither blocks the loop.
+Prediction rows still go through AUDIT_QUEUE. Every other route, including
+the GET forms and the templates, is served by the Flask app, which runs on
+a thread once its body has arrived. That body is spooled to a temporary file
+past SOIL_ASGI_SPOOL_BYTES instead of being held in memory. The response is
+sent chunk by chunk as Flask produces it, so the streamed routes
+(/history/export, /predict_soil/batch) stream here too.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from flask import render_template
+from itsdangerous import BadSignature
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import final_product as fp
+from features import InvalidFeatures
+
+INFERENCE_EXECUTOR = ThreadPoolExecutor(int(os.environ.get('SOIL_ASGI_INFERENCE_THREADS', os.cpu_count() or 4)),
+                                        thread_name_prefix='asgi-inference')
+DB_EXECUTOR = ThreadPoolExecutor(int(os.environ.get('SOIL_DB_POOL_MAX', 4)), thread_name_prefix='asgi-db')
+WSGI_EXECUTOR = ThreadPoolExecutor(int(os.environ.get('SOIL_ASGI_WSGI_THREADS', 16)), thread_name_prefix='asgi-wsgi')
+# Request bodies for the Flask routes are kept in memory up to this size, then spooled to disk
+SPOOL_BYTES = int(os.environ.get('SOIL_ASGI_SPOOL_BYTES', 1024 * 1024))
+
+_session_serializer = fp.app.session_interface.get_signing_serializer(fp.app)
+
+
+def run_in(executor, fn, *args, **kwargs):
+    return asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args, **kwargs))
+
+
+async def current_user(request):
+    """The logged-in user from Flask's signed session cookie, like Flask-Login's current_user."""
+    cookie = request.cookies.get(fp.app.config['SESSION_COOKIE_NAME'])
+    if not cookie or _session_serializer is None:
+        return None
+    try:
+        session = _session_serializer.loads(cookie, max_age=int(fp.app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    user_id = session.get('_user_id')
+    if user_id is None:
+        return None
+    user = fp.USER_CACHE.get(user_id)
+    if user is None:
+        user = await run_in(DB_EXECUTOR, fp.load_user, user_id)
+    return user
+
+
+def wants_json(request):
+    # Same rules as final_product.wants_json
+    if request.query_params.get('format') == 'json':
+        return True
+    accept = parse_accept_header(request.headers.get('accept'), MIMEAccept)
+    best = accept.best_match(['text/html', 'application/json'])
+    return best == 'application/json' and accept[best] > accept['text/html']
+
+
+def login_redirect(request):
+    # What Flask-Login's login_required does for anonymous users
+    return RedirectResponse('/login?next=' + request.url.path, status_code=302)
+
+
+def render(template, **context):
+    with fp.app.test_request_context():
+        return render_template(template, **context)
+
+
+async def predict_soil(request):
+    if await current_user(request) is None:
+        return login_redirect(request)
+    with fp.STAGE_SECONDS.time(route='predict_soil', stage='read'):
+        async with request.form() as form:
+            upload = form.get('file')
+            data = await upload.read() if upload is not None and hasattr(upload, 'read') else b''
+    if not data:
+        return JSONResponse({'error': 'No image uploaded.'}, status_code=400)
+    try:
+        prediction = await run_in(INFERENCE_EXECUTOR, fp.classify_soil, data, 'predict_soil')
+    except fp.InferenceTimeout:
+        return JSONResponse({'error': 'Prediction timed out, please try again.'}, status_code=504)
+    return JSONResponse({
+        'class': fp.labels[int(prediction.argmax())],
+        'probability': float(prediction.max())
+    })
+
+
+async def predict(request):
+    with fp.STAGE_SECONDS.time(route='predict', stage='parse'):
+        form = await request.form()
+    user = await current_user(request)
+    if user is None:
+        return login_redirect(request)
+
+    use_cache = not (form.get('nocache') or 'no-cache' in request.headers.get('cache-control', ''))
+    try:
+        k = int(request.query_params.get('top_k') or form.get('top_k') or fp.TOP_K)
+    except ValueError:
+        k = fp.TOP_K
+    try:
+        row, values, ranking = await run_in(INFERENCE_EXECUTOR, fp.recommend, form, use_cache, k)
+    except InvalidFeatures as exc:
+        fp.log.info("Invalid input values", extra={'fields': {'error': str(exc)}})
+        if wants_json(request):
+            return JSONResponse({'error': str(exc)}, status_code=400)
+        return HTMLResponse("Sorry... Error in entered values in the form. Please check the values and fill it again.")
+
+    crop = ranking[0][0]
+    if crop not in fp.crop_dict:
+        fp.log.warning("Crop not found in dictionary", extra={'fields': {'crop': repr(crop)}})
+        if wants_json(request):
+            return JSONResponse({'error': 'Could not determine the best crop.'}, status_code=422)
+        return HTMLResponse("Sorry, we could not determine the best crop to be cultivated with the provided data.")
+
+    top_crops = [{'crop': c, 'score': score} for c, score in ranking if c in fp.crop_dict]
+    similar = await run_in(INFERENCE_EXECUTOR, fp.record_recommendation, user, row, values, crop)
+    with fp.STAGE_SECONDS.time(route='predict', stage='render'):
+        if wants_json(request):
+            return JSONResponse({'crop': crop, 'top_crops': top_crops, 'similar': similar})
+        html = await run_in(INFERENCE_EXECUTOR, render, 'index.html', result="{} is the suitable crop ".format(crop),
+                            top_crops=top_crops, similar=similar)
+        return HTMLResponse(html)
+
+
+ASYNC_ROUTES = {
+    ('POST', '/predict_soil'): predict_soil,
+    ('POST', '/predict'): predict,
+}
+
+
+def wsgi_environ(scope, body, length):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(length),
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = server[0], str(server[1])
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = 'HTTP_' + name
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+def run_wsgi(environ, send_message):
+    """Run the Flask app on this thread, passing each chunk of its response to ``send_message``.
+
+    The whole response is iterated on one thread, because stream_with_context
+    generators must be resumed in the context they were started in.
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+
+    def start():
+        if not response.get('started'):
+            response['started'] = True
+            send_message({'type': 'http.response.start', 'status': response['status'],
+                          'headers': response['headers']})
+
+    result = fp.app(environ, start_response)
+    try:
+        for chunk in result:
+            if chunk:
+                start()
+                send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        start()
+        send_message({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+async def call_flask(scope, receive, send):
+    # Receive the whole body on the loop first, so the WSGI thread never waits on the client
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    try:
+        length = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunk = message.get('body', b'')
+            body.write(chunk)
+            length += len(chunk)
+            more_body = message.get('more_body', False)
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+
+        def send_message(message):
+            # Waiting for each send keeps a slow client from piling chunks up in memory
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        await run_in(WSGI_EXECUTOR, run_wsgi, wsgi_environ(scope, body, length), send_message)
+    finally:
+        body.close()
+
+
+async def call_async_route(handler, scope, receive, send):
+    # Counted in the same /metrics series the Flask routes use
+    started = time.perf_counter()
+    try:
+        response = await handler(Request(scope, receive))
+    except Exception:
+        fp.log.exception("Unhandled error in %s", scope['path'])
+        response = PlainTextResponse("Internal Server Error", status_code=500)
+    try:
+        await response(scope, receive, send)
+    finally:
+        fp.HTTP_LATENCY.observe(time.perf_counter() - started, route=scope['path'], method=scope['method'])
+        fp.HTTP_REQUESTS.inc(route=scope['path'], method=scope['method'], status=response.status_code)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if fp.EAGER_LOAD:
+                await run_in(WSGI_EXECUTOR, fp.warm_up)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for executor in (INFERENCE_EXECUTOR, DB_EXECUTOR, WSGI_EXECUTOR):
+                executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+    if handler is not None:
+        await call_async_route(handler, scope, receive, send)
+    else:
+        await call_flask(scope, receive, send)
@@ -0,0 +1,245 @@
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# created_at is bound as UTC text with millisecond precision, the format of predicted_at()
+_INSERT = ("INSERT INTO prediction (name, mobile_number, N, P, K, temperature, humidity, ph, rainfall, soil, "
+           "predicted_crop, created_at) VALUES (:1, :2, :3, :4, :5, :6, :7, :8, :9, :10, :11, {})")
+INSERT_PREDICTION = {
+    'oracle': _INSERT.format("TO_TIMESTAMP(:12, 'YYYY-MM-DD HH24:MI:SS.FF3')"),
+    'sqlite': _INSERT.format(":12"),
+}
+# Rows spilled before created_at was recorded have one field less
+_LEGACY_RECORD_LENGTH = 11
+
+_STOP = object()
+
+log = logging.getLogger('soil.audit')
+
+
+def predicted_at():
+    """The current UTC time as stored in ``prediction.created_at``."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+@contextmanager
+def _file_lock(path, blocking=True):
+    """An exclusive ``flock`` on ``path``; yields False if ``blocking`` is off and it is taken."""
+    with open(path, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class PredictionAuditQueue:
+    """Write-behind queue for ``prediction`` rows.
+
+    Records end with their ``created_at`` (``predicted_at()`` when the
+    prediction was made), so rows keep their time however late they are
+    written or replayed. ``put`` only appends to a bounded in-process queue; a background thread
+    inserts the rows with ``executemany`` once ``batch_size`` rows are
+    waiting or ``flush_interval`` seconds have passed. When the queue is full
+    ``put`` blocks for at most ``block_timeout`` seconds and then spills the
+    row to ``spill_path`` (JSON lines) instead of slowing the request down
+    further. Rows whose insert fails are spilled too, and the spill file is
+    replayed after the next successful flush.
+
+    Every worker process shares the spill file, so appends and the move
+    aside hold a ``flock`` on ``<spill_path>.lock``. Only one process
+    replays at a time (``<spill_path>.replay.lock``), and a ``.replay`` file
+    left by a process that died mid-replay is picked up by the next one.
+    """
+
+    def __init__(self, pool, max_size=10000, batch_size=100, flush_interval=1.0,
+                 spill_path='prediction_spill.jsonl', block_timeout=0.05):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self._enqueued = 0
+        self._inserted = 0
+        self._flushes = 0
+        self._spilled = 0
+        self._replayed = 0
+        self._errors = 0
+        self._flush_time = 0.0
+        self._flush_time_max = 0.0
+
+    def _ensure_worker(self):
+        # Started on first use so that forked workers get their own thread
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="prediction-audit", daemon=True)
+                    self._thread.start()
+
+    def put(self, record):
+        """Queue one prediction row; returns False if it had to be spilled to disk."""
+        record = tuple(record)
+        if self._closed:
+            self._spill([record])
+            return False
+        self._ensure_worker()
+        try:
+            self._queue.put(record, timeout=self.block_timeout)
+        except queue.Full:
+            self._spill([record])
+            return False
+        with self._stats_lock:
+            self._enqueued += 1
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                if self._run_once():
+                    return
+            except Exception:
+                # Keep the writer alive so later rows are still written
+                with self._stats_lock:
+                    self._errors += 1
+                log.exception("Prediction audit writer failed")
+
+    def _run_once(self):
+        """Collect and flush one batch; returns True once the queue is closed."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        stop = False
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        if batch:
+            self._flush(batch)
+        return stop
+
+    def _insert(self, rows):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(INSERT_PREDICTION[self.pool.dialect], rows)
+            conn.commit()
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            self._insert(batch)
+        except Exception:
+            with self._stats_lock:
+                self._errors += 1
+            self._spill(batch)
+            return
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._flushes += 1
+            self._inserted += len(batch)
+            self._flush_time += elapsed
+            self._flush_time_max = max(self._flush_time_max, elapsed)
+        self._replay_spill()
+
+    def _spill(self, rows):
+        with self._spill_lock, _file_lock(self.spill_path + '.lock'):
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+        with self._stats_lock:
+            self._spilled += len(rows)
+
+    def _replay_spill(self):
+        replay_path = self.spill_path + '.replay'
+        with _file_lock(self.spill_path + '.replay.lock', blocking=False) as owner:
+            if not owner:
+                return  # another worker is replaying
+            if not os.path.exists(replay_path):
+                with self._spill_lock, _file_lock(self.spill_path + '.lock'):
+                    if not os.path.exists(self.spill_path) or os.path.getsize(self.spill_path) == 0:
+                        return
+                    # Move the file aside so requests can keep spilling while we replay
+                    os.replace(self.spill_path, replay_path)
+            rows = []
+            with open(replay_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        row = tuple(json.loads(line))
+                    except ValueError:
+                        # A line cut short by a crash would otherwise block every later replay
+                        if line.strip():
+                            log.warning("Skipping unreadable spilled prediction", extra={'fields': {'line': line[:200]}})
+                        continue
+                    rows.append(row + (predicted_at(),) if len(row) == _LEGACY_RECORD_LENGTH else row)
+            done = 0
+            try:
+                for done in range(0, len(rows), self.batch_size):
+                    self._insert(rows[done:done + self.batch_size])
+                done = len(rows)
+            except Exception:
+                with self._stats_lock:
+                    self._errors += 1
+                self._spill(rows[done:])
+            os.remove(replay_path)
+        with self._stats_lock:
+            self._replayed += done
+
+    def close(self, timeout=30):
+        """Flush everything still queued and stop the worker."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        # Anything left behind (worker never started or timed out) goes to disk
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            self._spill(leftovers)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_size': self._queue.maxsize,
+                'batch_size': self.batch_size,
+                'flush_interval_s': self.flush_interval,
+                'enqueued': self._enqueued,
+                'inserted': self._inserted,
+                'flushes': self._flushes,
+                'spilled': self._spilled,
+                'replayed': self._replayed,
+                'errors': self._errors,
+                'mean_flush_ms': self._flush_time * 1000.0 / self._flushes if self._flushes else 0.0,
+                'max_flush_ms': self._flush_time_max * 1000.0,
+            }
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# Upper bounds (ms) of the wait-time histogram buckets
+WAIT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-sample predictions into one batched call.
+
+    Callers ``submit`` one input at a time from any request thread. A single
+    background thread waits up to ``max_wait_ms`` after the first pending
+    input (or until ``max_batch_size`` inputs are queued), stacks them, runs
+    ``predict_fn`` once and hands every caller its own row of the output.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._batch_sizes = {}
+        self._wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._wait_sum = 0.0
+        self._wait_max = 0.0
+        self._run_sum = 0.0
+
+    def submit(self, item):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            # The worker is started on first use so that forked workers get their own thread
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="soil-microbatcher", daemon=True)
+                self._thread.start()
+            self._pending.append((item, time.perf_counter(), future))
+            self._cond.notify()
+        return future
+
+    def predict(self, item, timeout=None):
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][1] + self.max_wait
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            size = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                outputs = self.predict_fn(np.stack([item for item, _, _ in batch]))
+            except Exception as exc:
+                self._errors += 1
+                for _, _, future in batch:
+                    future.set_exception(exc)
+            else:
+                for i, (_, _, future) in enumerate(batch):
+                    future.set_result(outputs[i])
+            self._record(batch, started, time.perf_counter())
+
+    def _record(self, batch, started, finished):
+        with self._cond:
+            self._batches += 1
+            self._items += len(batch)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            self._run_sum += finished - started
+            for _, enqueued, _ in batch:
+                wait = started - enqueued
+                self._wait_sum += wait
+                self._wait_max = max(self._wait_max, wait)
+                wait_ms = wait * 1000.0
+                for i, bound in enumerate(WAIT_BUCKETS_MS):
+                    if wait_ms <= bound:
+                        self._wait_buckets[i] += 1
+                        break
+                else:
+                    self._wait_buckets[-1] += 1
+
+    def stats(self):
+        with self._cond:
+            bucket_names = ["<={}ms".format(b) for b in WAIT_BUCKETS_MS] + [">{}ms".format(WAIT_BUCKETS_MS[-1])]
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queue_depth': len(self._pending),
+                'batches': self._batches,
+                'items': self._items,
+                'errors': self._errors,
+                'mean_batch_size': self._items / self._batches if self._batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'wait_ms_histogram': dict(zip(bucket_names, self._wait_buckets)),
+                'mean_wait_ms': self._wait_sum * 1000.0 / self._items if self._items else 0.0,
+                'max_wait_ms_seen': self._wait_max * 1000.0,
+                'mean_predict_ms': self._run_sum * 1000.0 / self._batches if self._batches else 0.0,
+            }
@@ -0,0 +1,119 @@
+"""Load time and memory of the columnar format against pd.read_csv.
+
+    python benchmarks/bench_columnar.py [--synthetic-rows 10000000]
+
+Runs on dataset.csv and on a synthetic CSV of --synthetic-rows rows made by
+jittering dataset.csv. Every measurement runs in a fresh interpreter and reports
+the resident memory it added, so runs do not affect each other.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from columnar import ColumnarDataset, convert  # noqa: E402
+from features import DATASET_DTYPES  # noqa: E402
+
+
+def rss_mb():
+    # Current resident set size (Linux); falls back to the peak elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def measure(kind, path):
+    baseline = rss_mb()
+    started = time.perf_counter()
+    if kind == 'read_csv':
+        frame = pd.read_csv(path)
+        rows = len(frame)
+    elif kind == 'read_csv_dtypes':
+        frame = pd.read_csv(path, dtype=DATASET_DTYPES)
+        rows = len(frame)
+    elif kind == 'columnar_full':
+        dataset = ColumnarDataset(path)
+        matrix = dataset.features(dtype=np.float32)
+        labels = dataset.label_codes()
+        rows = len(matrix) + 0 * len(labels)
+    elif kind == 'columnar_slice':
+        dataset = ColumnarDataset(path)
+        middle = len(dataset) // 2
+        matrix = dataset.features(middle, middle + 100000)
+        rows = len(matrix)
+    else:
+        raise ValueError(kind)
+    return {'kind': kind, 'rows': rows, 'seconds': time.perf_counter() - started,
+            'rss_delta_mb': rss_mb() - baseline}
+
+
+def run_child(kind, path):
+    out = subprocess.run([sys.executable, __file__, '--measure', kind, path],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def synthesize(source, target, rows, chunk=1000000):
+    rng = np.random.default_rng(0)
+    frame = pd.read_csv(source)
+    numeric = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+    scale = frame[numeric].std().to_numpy() * 0.02
+    with open(target, 'w') as f:
+        f.write(",".join(frame.columns) + "\n")
+        for start in range(0, rows, chunk):
+            picks = frame.iloc[rng.integers(0, len(frame), min(chunk, rows - start))].reset_index(drop=True)
+            values = picks[numeric].to_numpy() + rng.normal(0, 1, (len(picks), len(numeric))) * scale
+            picks[numeric] = values
+            picks[['N', 'P', 'K']] = picks[['N', 'P', 'K']].round().clip(lower=0).astype(int)
+            picks['ph'] = picks['ph'].clip(0.1, 14)
+            picks.to_csv(f, header=False, index=False)
+
+
+def report(label, csv_path, work_dir):
+    columnar_dir = os.path.join(work_dir, os.path.basename(csv_path) + '.columnar')
+    started = time.perf_counter()
+    convert(csv_path, columnar_dir)
+    converted = time.perf_counter() - started
+    csv_mb = os.path.getsize(csv_path) / 1e6
+    col_mb = sum(os.path.getsize(os.path.join(columnar_dir, f)) for f in os.listdir(columnar_dir)) / 1e6
+    print("\n{}: CSV {:.1f} MB, columnar {:.1f} MB, conversion {:.2f}s".format(label, csv_mb, col_mb, converted))
+    print("{:<18} {:>12} {:>10} {:>16}".format('loader', 'rows', 'seconds', 'RSS +MB'))
+    for kind, path in (('read_csv', csv_path), ('read_csv_dtypes', csv_path),
+                       ('columnar_full', columnar_dir), ('columnar_slice', columnar_dir)):
+        r = run_child(kind, path)
+        print("{kind:<18} {rows:>12} {seconds:>10.3f} {rss_delta_mb:>16.1f}".format(**r))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=os.path.join(ROOT, 'dataset.csv'))
+    parser.add_argument('--synthetic-rows', type=int, default=10000000)
+    parser.add_argument('--measure', nargs=2, metavar=('KIND', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        report(os.path.basename(args.data), args.data, work_dir)
+        if args.synthetic_rows:
+            synthetic = os.path.join(work_dir, 'synthetic.csv')
+            synthesize(args.data, synthetic, args.synthetic_rows)
+            report("synthetic {} rows".format(args.synthetic_rows), synthetic, work_dir)
+
+
+if __name__ == '__main__':
+    main()
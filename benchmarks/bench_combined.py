@@ -0,0 +1,150 @@
+"""Latency of /predict/combined against the two-call /predict_soil + /predict flow.
+
+    python benchmarks/bench_combined.py [--requests 200] [--clients 1] [--soil-delay-ms 30]
+                                        [--workers 1] [--threads 4] [--out combined.json]
+
+The service is started with gunicorn in a scratch directory set up like
+load_test.py, with the stand-in soil model sleeping --soil-delay-ms per
+batch to mimic the real model. Each client sends the same photo and form in
+two ways. The two-call flow posts the photo to /predict_soil, maps the
+returned class to a Soil value and posts the form to /predict. The combined
+flow makes a single /predict/combined call. Latency is measured end to end
+from the client, and the flows alternate so both see the same server state.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from imaging import SOIL_FORM_VALUES  # noqa: E402
+from load_test import (form_rows, prepare_workdir, start_gunicorn, stop_gunicorn, synthetic_images,  # noqa: E402
+                       wait_until_up)
+
+
+def two_calls(session, base_url, image, row):
+    response = session.post(base_url + '/predict_soil', files={'file': ('soil.jpg', image, 'image/jpeg')})
+    response.raise_for_status()
+    soil = SOIL_FORM_VALUES[response.json()['class']]
+    response = session.post(base_url + '/predict?format=json', data=dict(row, Soil=soil))
+    response.raise_for_status()
+    return response.json()['crop']
+
+
+def combined(session, base_url, image, row):
+    fields = {k: v for k, v in row.items() if k != 'Soil'}
+    response = session.post(base_url + '/predict/combined', data=fields,
+                            files={'file': ('soil.jpg', image, 'image/jpeg')})
+    response.raise_for_status()
+    return response.json()['crop']
+
+
+FLOWS = {'two_calls': two_calls, 'combined': combined}
+
+
+class Client(threading.Thread):
+    def __init__(self, base_url, name, requests_per_flow, images, rows, seed):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.name = name
+        self.requests_per_flow = requests_per_flow
+        self.images = images
+        self.rows = rows
+        self.rng = np.random.default_rng(seed)
+        self.timings = {flow: [] for flow in FLOWS}
+        self.errors = {flow: 0 for flow in FLOWS}
+        self.mismatches = 0
+
+    def run(self):
+        session = requests.Session()
+        credentials = {'name': self.name, 'mobile_number': '9' * 10}
+        session.post(self.base_url + '/register', data=credentials, allow_redirects=False)
+        session.post(self.base_url + '/login', data=credentials, allow_redirects=False)
+        try:
+            for i in range(self.requests_per_flow):
+                image = self.images[self.rng.integers(len(self.images))]
+                row = self.rows[self.rng.integers(len(self.rows))]
+                crops = {}
+                # Alternate which flow goes first so neither always hits a warmer server
+                for flow in (FLOWS if i % 2 == 0 else reversed(list(FLOWS))):
+                    started = time.perf_counter()
+                    try:
+                        crops[flow] = FLOWS[flow](session, self.base_url, image, row)
+                    except (requests.RequestException, ValueError, KeyError):
+                        self.errors[flow] += 1
+                        continue
+                    self.timings[flow].append(time.perf_counter() - started)
+                if len(crops) == 2 and crops['two_calls'] != crops['combined']:
+                    self.mismatches += 1
+        finally:
+            session.close()
+
+
+def summarize(timings):
+    latencies = np.array(timings) * 1000.0
+    if not len(latencies):
+        return {'requests': 0}
+    return {'requests': len(latencies), 'mean_ms': float(latencies.mean()),
+            'p50_ms': float(np.percentile(latencies, 50)), 'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                       'dataset.csv'))
+    parser.add_argument('--requests', type=int, default=200, help="requests per flow per client")
+    parser.add_argument('--clients', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--soil-delay-ms', type=float, default=30.0)
+    parser.add_argument('--warmup', type=int, default=10, help="untimed requests per flow first")
+    parser.add_argument('--out', default='combined.json')
+    args = parser.parse_args()
+
+    rows = form_rows(args.data)
+    images = synthetic_images(6)
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir, args.data)
+        process, base_url = start_gunicorn(workdir, args.workers, args.threads, soil_delay_ms=args.soil_delay_ms)
+        try:
+            wait_until_up(base_url, process)
+            warmup = Client(base_url, 'combinedwarm', args.warmup, images, rows, seed=1000)
+            warmup.run()
+            clients = [Client(base_url, 'combined{}'.format(i), args.requests, images, rows, seed=i)
+                       for i in range(args.clients)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+        finally:
+            stop_gunicorn(process)
+
+    results = {flow: summarize([t for c in clients for t in c.timings[flow]]) for flow in FLOWS}
+    for flow in FLOWS:
+        results[flow]['errors'] = sum(c.errors[flow] for c in clients)
+    results['crop_mismatches'] = sum(c.mismatches for c in clients)
+    for flow in FLOWS:
+        r = results[flow]
+        print("{:<10} {:>5} requests  mean {:>7.1f}  p50 {:>7.1f}  p95 {:>7.1f}  p99 {:>7.1f} ms  {} errors".format(
+            flow, r['requests'], r.get('mean_ms', float('nan')), r.get('p50_ms', float('nan')),
+            r.get('p95_ms', float('nan')), r.get('p99_ms', float('nan')), r['errors']))
+    if results['two_calls'].get('p50_ms') and results['combined'].get('p50_ms'):
+        print("combined p50 is {:.2f}x the two-call flow; {} crop mismatches".format(
+            results['combined']['p50_ms'] / results['two_calls']['p50_ms'], results['crop_mismatches']))
+
+    with open(args.out, 'w') as f:
+        json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    print("Results written to {}".format(args.out))
+
+
+if __name__ == '__main__':
+    main()
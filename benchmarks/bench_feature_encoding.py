@@ -0,0 +1,79 @@
+"""Per-request cost of encoding /predict inputs, before and after FeatureEncoder.
+
+    python benchmarks/bench_feature_encoding.py [--runs 20000]
+
+"dataframe" is the original path (one-row DataFrame, .values[0] reads,
+.map and .reindex); "encoder" is FeatureEncoder on the same form fields.
+The batch rows compare encode_record_frame (DataFrame.from_records +
+encode_frame) with FeatureEncoder.encode_records on JSON-style lists of
+samples; the crossover sets VECTORIZED_ENCODING_MIN_ROWS in final_product.py.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features import FEATURE_COLUMNS, FORM_FIELDS, FeatureEncoder, encode_record_frame  # noqa: E402
+
+FORM = {'Nitrogen': '90', 'Phosphorus': '42', 'Potassium': '43', 'Temperature': '20.87',
+        'Humidity': '82.00', 'pH': '6.50', 'Rainfall': '202.93', 'Soil': 'Alluvial'}
+
+
+def dataframe_path(form):
+    N = int(form['Nitrogen'])
+    P = int(form['Phosphorus'])
+    K = int(form['Potassium'])
+    temp = float(form['Temperature'])
+    humidity = float(form['Humidity'])
+    ph = float(form['pH'])
+    rainfall = float(form['Rainfall'])
+    soil = form['Soil']
+    input_df = pd.DataFrame({'N': [N], 'P': [P], 'K': [K], 'temperature': [temp],
+                             'humidity': [humidity], 'ph': [ph], 'rainfall': [rainfall], 'soil': [soil]})
+    ph_value = float(input_df['ph'].values[0])
+    temp_value = float(input_df['temperature'].values[0])
+    humidity_value = float(input_df['humidity'].values[0])
+    soil_value = input_df['soil'].values[0]
+    if 0 < ph_value <= 14 and 0 < temp_value < 60 and humidity_value > 0 and soil_value in ["Alluvial", "Black", "Clay", "Red"]:
+        input_df['soil'] = input_df['soil'].map({'Alluvial': 0, 'Black': 1, 'Clay': 2, 'Red': 3})
+        return input_df.reindex(columns=FEATURE_COLUMNS, fill_value=0)
+
+
+def per_call_us(fn, arg, runs):
+    fn(arg)
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn(arg)
+    return (time.perf_counter() - started) / runs * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20000)
+    args = parser.parse_args()
+
+    form_encoder = FeatureEncoder(FORM_FIELDS)
+    record_encoder = FeatureEncoder()
+    rows = [
+        ('single: dataframe', per_call_us(dataframe_path, FORM, args.runs // 10)),
+        ('single: encoder', per_call_us(form_encoder.encode, FORM, args.runs)),
+    ]
+    for size in (10, 100, 1000, 10000):
+        records = [dict(zip(FEATURE_COLUMNS, [90, 42, 43, 20.87, 82.0, 6.5, 202.9, 'Alluvial']))] * size
+        batch_runs = max(args.runs // size, 5)
+        rows.append(('{} rows: encode_record_frame'.format(size),
+                     per_call_us(encode_record_frame, records, batch_runs)))
+        rows.append(('{} rows: encode_records'.format(size),
+                     per_call_us(record_encoder.encode_records, records, batch_runs)))
+    for name, us in rows:
+        print("{:<42} {:>10.1f} us".format(name, us))
+    assert np.allclose(dataframe_path(FORM).to_numpy(dtype=np.float32)[0], form_encoder.encode(FORM))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Query time of the /history queries on a synthetic multi-million-row prediction table.
+
+    python benchmarks/bench_history.py [--rows 2000000] [--users 2000] [--heavy-rows 200000]
+                                       [--depth 100000] [--db history_bench.db] [--out history.json]
+
+Fills a SQLite prediction table through SqlitePool. Rows are spread over
+--users users plus one heavy user with --heavy-rows rows, and span two years
+of created_at. The heavy user's history is then read in several ways, first
+without the indexes from prediction_history.sql and then with them:
+
+* the first page, and a page --depth rows deep with OFFSET and with a keyset
+  cursor (history.build_query);
+* a crop-filtered page and a date-range page;
+* the full export through fetchmany at several array sizes.
+
+Each timing is the median of --repeat runs. An existing --db is reused when
+it already has the requested row count (--rebuild forces a new one). Only
+SQLite can be measured here. With Oracle the array size matters even more,
+because each fetch is a network round trip.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import SqlitePool  # noqa: E402
+from features import SOIL_CODES  # noqa: E402
+from history import HISTORY_COLUMNS, build_query, iter_history  # noqa: E402
+
+INDEXES = ['prediction_name_created', 'prediction_name_crop_created', 'prediction_name_soil_created']
+CROPS = ['rice', 'maize', 'jute', 'cotton', 'coconut', 'papaya', 'orange', 'apple', 'muskmelon', 'watermelon',
+         'grapes', 'mango', 'banana', 'pomegranate', 'lentil', 'blackgram', 'mungbean', 'mothbeans', 'pigeonpeas',
+         'kidneybeans', 'chickpea', 'coffee']
+HEAVY_USER = 'heavyuser'
+START = datetime(2024, 1, 1)
+SPAN_SECONDS = 2 * 365 * 24 * 3600
+INSERT = ("INSERT INTO prediction (name, mobile_number, N, P, K, temperature, humidity, ph, rainfall, soil, "
+          "predicted_crop, created_at) VALUES (:1, :2, :3, :4, :5, :6, :7, :8, :9, :10, :11, :12)")
+
+
+def fill(pool, rows, users, heavy_rows, seed=0, chunk=100000):
+    rng = np.random.default_rng(seed)
+    soils = list(SOIL_CODES)
+    total = rows + heavy_rows
+    # Heavy-user rows are spread evenly through the table like everyone else's
+    heavy = np.zeros(total, dtype=bool)
+    heavy[rng.choice(total, heavy_rows, replace=False)] = True
+    offsets = np.sort(rng.uniform(0, SPAN_SECONDS, total))
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, total, chunk):
+            n = min(chunk, total - start)
+            user_ids = rng.integers(users, size=n)
+            names = np.where(heavy[start:start + n], HEAVY_USER,
+                             np.char.add('user', user_ids.astype(str))).tolist()
+            npk = rng.integers(0, 140, size=(n, 3)).tolist()
+            climate = rng.uniform([10, 15, 4, 20], [40, 99, 9, 300], size=(n, 4)).round(3).tolist()
+            soil = rng.integers(len(soils), size=n).tolist()
+            crop = rng.integers(len(CROPS), size=n).tolist()
+            times = [(START + timedelta(seconds=float(s))).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+                     for s in offsets[start:start + n]]
+            cursor.executemany(INSERT, [
+                (names[i], '9999999999') + tuple(npk[i]) + tuple(climate[i])
+                + (soils[soil[i]], CROPS[crop[i]], times[i]) for i in range(n)])
+            conn.commit()
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return float(np.median(timings))
+
+
+def run_query(pool, sql, params, arraysize=51):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.arraysize = arraysize
+        cursor.execute(sql, params)
+        return cursor.fetchmany(arraysize)
+
+
+def cursor_at(pool, depth):
+    # Key of the row just above the requested depth, as the previous page's cursor would hold
+    sql, params = build_query(HEAVY_USER, {}, dialect='sqlite')
+    row = run_query(pool, sql + ' LIMIT 1 OFFSET {:d}'.format(depth - 1), params, 1)[0]
+    record = dict(zip(HISTORY_COLUMNS, row))
+    return datetime.fromisoformat(record['created_at']), record['id']
+
+
+def query_plan(pool, sql, params):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return ' / '.join(row[-1] for row in cursor.fetchall())
+
+
+def measure(pool, args):
+    page = 50
+    after = cursor_at(pool, args.depth)
+    first_sql, first_params = build_query(HEAVY_USER, {}, limit=page + 1, dialect='sqlite')
+    base_sql, base_params = build_query(HEAVY_USER, {}, dialect='sqlite')
+    offset_sql = base_sql + ' LIMIT {:d} OFFSET {:d}'.format(page + 1, args.depth)
+    keyset_sql, keyset_params = build_query(HEAVY_USER, {}, after, page + 1, 'sqlite')
+    crop_sql, crop_params = build_query(HEAVY_USER, {'crop': 'rice'}, after, page + 1, 'sqlite')
+    range_sql, range_params = build_query(HEAVY_USER, {'from': datetime(2025, 3, 1), 'to': datetime(2025, 3, 8)},
+                                          limit=page + 1, dialect='sqlite')
+
+    results = {
+        'first_page_ms': timed(lambda: run_query(pool, first_sql, first_params), args.repeat),
+        'offset_page_ms': timed(lambda: run_query(pool, offset_sql, base_params), args.repeat),
+        'keyset_page_ms': timed(lambda: run_query(pool, keyset_sql, keyset_params), args.repeat),
+        'crop_keyset_page_ms': timed(lambda: run_query(pool, crop_sql, crop_params), args.repeat),
+        'date_range_page_ms': timed(lambda: run_query(pool, range_sql, range_params), args.repeat),
+        'keyset_plan': query_plan(pool, keyset_sql, keyset_params),
+    }
+    for arraysize in args.arraysizes:
+        results['export_ms_arraysize_{}'.format(arraysize)] = timed(
+            lambda: sum(1 for _ in iter_history(pool, HEAVY_USER, {}, arraysize)), max(1, args.repeat // 2))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--heavy-rows', type=int, default=200000)
+    parser.add_argument('--depth', type=int, default=100000, help="rows skipped before the deep page")
+    parser.add_argument('--arraysizes', type=lambda s: [int(v) for v in s.split(',')], default=[1, 50, 500, 5000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', default='history_bench.db')
+    parser.add_argument('--rebuild', action='store_true')
+    parser.add_argument('--out', default='history.json')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    pool = SqlitePool(args.db, max=2)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        count = cursor.execute("SELECT COUNT(*) FROM prediction").fetchone()[0]
+        if count and count != args.rows + args.heavy_rows:
+            raise SystemExit("{} holds {} rows; pass --rebuild or another --db".format(args.db, count))
+        for name in INDEXES:
+            cursor.execute("DROP INDEX IF EXISTS " + name)
+        conn.commit()
+
+    report = {'args': vars(args)}
+    if not count:
+        started = time.perf_counter()
+        fill(pool, args.rows, args.users, args.heavy_rows)
+        report['fill_seconds'] = time.perf_counter() - started
+        print("Inserted {} rows in {:.1f}s".format(args.rows + args.heavy_rows, report['fill_seconds']))
+
+    report['no_index'] = measure(pool, args)
+    started = time.perf_counter()
+    pool = SqlitePool(args.db, max=2)  # creates the indexes
+    with pool.connection() as conn:
+        conn.cursor().execute("ANALYZE")
+        conn.commit()
+    report['index_build_seconds'] = time.perf_counter() - started
+    report['indexed'] = measure(pool, args)
+
+    print("{:<28} {:>12} {:>12}".format('heavy user ({} rows)'.format(args.heavy_rows), 'no index', 'indexed'))
+    for key in report['indexed']:
+        if key.endswith('_ms') or '_ms_' in key:
+            print("{:<28} {:>9.2f} ms {:>9.2f} ms".format(key.replace('_ms', ''), report['no_index'][key],
+                                                          report['indexed'][key]))
+    print("indexes built in {:.1f}s; keyset plan: {}".format(report['index_build_seconds'],
+                                                            report['indexed']['keyset_plan']))
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results written to {}".format(args.out))
+
+
+if __name__ == '__main__':
+    main()
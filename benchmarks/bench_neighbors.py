@@ -0,0 +1,75 @@
+"""Query latency of the NeighbourIndex as the number of indexed rows grows.
+
+    python benchmarks/bench_neighbors.py [--sizes 2200,100000,1000000] [--k 5]
+
+Larger indexes are synthesized by jittering dataset.csv rows. For each size
+the build time, single-row query p50/p99 of the KD-tree and of a brute-force
+scan over the same standardized matrix are reported.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from neighbors import NeighbourIndex, load_training_rows  # noqa: E402
+
+
+def synthesize(matrix, labels, size, rng):
+    picks = rng.integers(0, len(matrix), size)
+    jitter = rng.normal(0, 0.02, (size, matrix.shape[1])) * matrix.std(axis=0)
+    jitter[:, -1] = 0  # keep soil codes intact
+    return matrix[picks] + jitter, labels[picks]
+
+
+def percentiles(timings):
+    timings = np.array(timings) * 1000.0
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='dataset.csv')
+    parser.add_argument('--sizes', default='2200,100000,1000000')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix, labels = load_training_rows(args.data)
+    print("{:>10} {:>10} {:>12} {:>12} {:>14} {:>14}".format(
+        'rows', 'build s', 'tree p50 ms', 'tree p99 ms', 'brute p50 ms', 'brute p99 ms'))
+    for size in (int(s) for s in args.sizes.split(',')):
+        data, data_labels = synthesize(matrix, labels, size, rng)
+        queries = data[rng.integers(0, size, args.queries)]
+        with tempfile.TemporaryDirectory() as path:
+            started = time.perf_counter()
+            NeighbourIndex.build(data, data_labels, path=path)
+            index = NeighbourIndex.open(path)
+            build = time.perf_counter() - started
+
+            tree_times = []
+            for q in queries:
+                started = time.perf_counter()
+                index.query(q, args.k)
+                tree_times.append(time.perf_counter() - started)
+
+            scaled = (np.asarray(data, dtype=np.float32) - index.mean) / index.std
+            brute_times = []
+            for q in queries[:min(len(queries), 100)]:
+                started = time.perf_counter()
+                d = ((scaled - (q - index.mean) / index.std) ** 2).sum(axis=1)
+                np.argpartition(d, args.k)[:args.k]
+                brute_times.append(time.perf_counter() - started)
+            del index
+
+        print("{:>10} {:>10.2f} {:>12.3f} {:>12.3f} {:>14.3f} {:>14.3f}".format(
+            size, build, *percentiles(tree_times), *percentiles(brute_times)))
+
+
+if __name__ == '__main__':
+    main()
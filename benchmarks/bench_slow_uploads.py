@@ -0,0 +1,156 @@
+"""Fast-client latency while slow clients trickle in image uploads, WSGI vs ASGI.
+
+    python benchmarks/bench_slow_uploads.py [--slow-clients 32] [--upload-kbps 64] [--fast-clients 4]
+                                            [--duration 20] [--workers 2] [--threads 4]
+                                            [--out slow_uploads.json]
+
+The service is started twice in a scratch directory set up like
+load_test.py. The first run uses gunicorn gthread workers on the Flask app
+(load_test_app:app), and the second uses uvicorn workers on the ASGI app
+(load_test_app:asgi_app). In each run, --slow-clients connections upload a
+JPEG to /predict_soil at --upload-kbps and start over as soon as one
+finishes. Meanwhile --fast-clients post /predict forms back to back. The
+benchmark reports fast-client req/s and latency percentiles, and how many
+slow uploads completed.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import (Client, form_rows, prepare_workdir, start_gunicorn, stop_gunicorn,  # noqa: E402
+                       summarize, synthetic_images, wait_until_up)
+
+SERVERS = {
+    'wsgi_gthread': ('load_test_app:app', None),
+    'asgi_uvicorn': ('load_test_app:asgi_app', 'uvicorn.workers.UvicornWorker'),
+}
+
+
+def login_cookie(base_url, name):
+    session = requests.Session()
+    session.post(base_url + '/register', data={'name': name, 'mobile_number': '9' * 10}, allow_redirects=False)
+    session.post(base_url + '/login', data={'name': name, 'mobile_number': '9' * 10}, allow_redirects=False)
+    cookie = '; '.join('{}={}'.format(c.name, c.value) for c in session.cookies)
+    session.close()
+    return cookie
+
+
+class SlowUploader(threading.Thread):
+    """Uploads ``image`` to /predict_soil over a raw socket at ``kbps``, over and over."""
+
+    def __init__(self, base_url, cookie, image, kbps, stop_at):
+        super().__init__(daemon=True)
+        host, port = base_url.rsplit('/', 1)[-1].split(':')
+        self.address = (host, int(port))
+        boundary = 'soilboundary7MA4YWxkTrZu0gW'
+        self.body = ('--{b}\r\nContent-Disposition: form-data; name="file"; filename="soil.jpg"\r\n'
+                     'Content-Type: image/jpeg\r\n\r\n'.format(b=boundary).encode() + image
+                     + '\r\n--{}--\r\n'.format(boundary).encode())
+        self.head = ('POST /predict_soil HTTP/1.1\r\nHost: {}:{}\r\nCookie: {}\r\n'
+                     'Content-Type: multipart/form-data; boundary={}\r\nContent-Length: {}\r\n'
+                     'Connection: close\r\n\r\n'.format(host, port, cookie, boundary, len(self.body))).encode()
+        self.chunk = max(1, int(kbps * 1024 / 10))
+        self.stop_at = stop_at
+        self.completed = 0
+        self.failed = 0
+
+    def upload(self):
+        with socket.create_connection(self.address, timeout=120) as sock:
+            sock.sendall(self.head)
+            for start in range(0, len(self.body), self.chunk):
+                sock.sendall(self.body[start:start + self.chunk])
+                time.sleep(0.1)
+            status = sock.recv(64).split(b' ', 2)[1]
+        return status == b'200'
+
+    def run(self):
+        while time.perf_counter() < self.stop_at:
+            try:
+                ok = self.upload()
+            except OSError:
+                ok = False
+            if time.perf_counter() >= self.stop_at:
+                break
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+
+def run_server(name, args, workdir, rows, images):
+    app, worker_class = SERVERS[name]
+    process, base_url = start_gunicorn(workdir, args.workers, args.threads, app=app, worker_class=worker_class,
+                                       soil_delay_ms=args.soil_delay_ms)
+    try:
+        wait_until_up(base_url, process)
+        cookie = login_cookie(base_url, 'slowupload{}'.format(os.getpid()))
+        measure_from = time.perf_counter() + args.warmup
+        stop_at = measure_from + args.duration
+        slow = [SlowUploader(base_url, cookie, images[i % len(images)], args.upload_kbps, stop_at)
+                for i in range(args.slow_clients)]
+        fast = [Client(base_url, {'predict': 1}, rows, images, stop_at, seed=i) for i in range(args.fast_clients)]
+        for client in slow + fast:
+            client.start()
+        for client in fast:
+            client.join()
+        for client in slow:
+            client.join(timeout=1)
+
+        records = [r for c in fast for r in c.records if r[0] == 'predict' and r[1] >= measure_from]
+        result = {'server': name, 'workers': args.workers, 'threads': args.threads}
+        result['fast'] = summarize(records, args.duration)
+        result['slow_uploads'] = {'completed': sum(c.completed for c in slow), 'failed': sum(c.failed for c in slow)}
+        return result
+    finally:
+        stop_gunicorn(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                       'dataset.csv'))
+    parser.add_argument('--servers', default=','.join(SERVERS))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help="threads per gthread worker (WSGI only)")
+    parser.add_argument('--slow-clients', type=int, default=32)
+    parser.add_argument('--upload-kbps', type=float, default=64.0)
+    parser.add_argument('--fast-clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--soil-delay-ms', type=float, default=0.0)
+    parser.add_argument('--out', default='slow_uploads.json')
+    args = parser.parse_args()
+
+    rows = form_rows(args.data)
+    images = synthetic_images(8)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir, args.data)
+        for name in args.servers.split(','):
+            for db_file in os.listdir(workdir):
+                if db_file.startswith('soil.db'):
+                    os.remove(os.path.join(workdir, db_file))
+            result = run_server(name, args, workdir, rows, images)
+            fast = result['fast']
+            print("{:<14} /predict {:>7.1f} req/s  p50 {:>8.1f}  p95 {:>8.1f}  p99 {:>8.1f} ms  {} errors  "
+                  "slow uploads {completed} done, {failed} failed".format(
+                      name, fast['req_per_s'], fast.get('p50_ms', float('nan')), fast.get('p95_ms', float('nan')),
+                      fast.get('p99_ms', float('nan')), fast['errors'], **result['slow_uploads']))
+            results.append(result)
+
+    with open(args.out, 'w') as f:
+        json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    print("Results written to {}".format(args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Compare Keras MODEL.predict with the compiled SoilClassifier path.
+
+    python benchmarks/bench_soil_inference.py [--images DIR] [--runs 200]
+
+Without --images a set of random 224x224 images is used.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from imaging import IMAGE_SIZE, read_file_as_image  # noqa: E402
+from soil_model import SoilClassifier  # noqa: E402
+
+
+def load_images(directory, count):
+    if directory is None:
+        rng = np.random.default_rng(0)
+        return [rng.random((IMAGE_SIZE[0], IMAGE_SIZE[1], 3), dtype=np.float32) for _ in range(count)]
+    images = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            images.append(read_file_as_image(f.read()))
+    return images
+
+
+def measure(fn, images, runs):
+    timings = []
+    for i in range(runs):
+        batch = images[i % len(images)][np.newaxis]
+        started = time.perf_counter()
+        fn(batch)
+        timings.append((time.perf_counter() - started) * 1000.0)
+    timings = np.array(timings)
+    return {'p50_ms': float(np.percentile(timings, 50)), 'p99_ms': float(np.percentile(timings, 99)),
+            'mean_ms': float(timings.mean())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model-dir', default='./models/1')
+    parser.add_argument('--images', default=None, help="directory of sample soil images")
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    classifier = SoilClassifier(args.model_dir)
+    images = load_images(args.images, 16)
+
+    # Warm both paths before timing
+    classifier.model.predict(images[0][np.newaxis], verbose=0)
+    classifier.predict(images[0][np.newaxis])
+
+    results = {
+        'keras_predict': measure(lambda b: classifier.model.predict(b, verbose=0), images, args.runs),
+        'compiled': measure(classifier.predict, images, args.runs),
+    }
+    for name, stats in results.items():
+        print("{:<14} p50 {p50_ms:8.2f} ms   p99 {p99_ms:8.2f} ms   mean {mean_ms:8.2f} ms".format(name, **stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""Load test the whole Flask service under gunicorn.
+
+    python benchmarks/load_test.py [--configs 1x1,2x4,4x4] [--duration 20] [--concurrency 16]
+                                   [--mix login=1,register=1,predict=6,predict_soil=2]
+                                   [--out load_test.json] [--baseline previous.json]
+
+Every worker configuration (``<workers>x<threads>``) starts gunicorn on
+benchmarks/load_test_app.py in a scratch directory, with the SQLite stand-in
+for Oracle (SOIL_DB_BACKEND=sqlite). The repo's crop.pkl and ./models are
+used when present. Otherwise a decision tree fitted on dataset.csv stands in
+for the crop model, and a fixed projection stands in for the soil model
+(see load_test_app.py). Both stand-ins are deterministic.
+
+Each client thread registers and logs in its own user. It then sends a
+weighted mix of requests built from dataset.csv rows and synthetic JPEGs
+until --duration runs out; the first --warmup seconds are not counted.
+Overall and per-endpoint req/s and p50/p95/p99 latency are reported, along
+with the RSS of the gunicorn master and every worker. Results are written to
+--out as JSON. With --baseline, req/s and p99 are compared to an earlier
+result file.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import pickle
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+import requests
+from PIL import Image
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from features import DATASET_DTYPES, FEATURE_COLUMNS, FORM_FIELDS, encode_frame  # noqa: E402
+
+DEFAULT_MIX = 'login=1,register=1,predict=6,predict_soil=2'
+IMAGE_SIZES = [(640, 480), (1024, 768), (2048, 1536)]
+
+
+def prepare_workdir(workdir, data):
+    """Copy dataset.csv and the models into ``workdir``, fitting a stand-in crop model if needed."""
+    shutil.copy(data, os.path.join(workdir, 'dataset.csv'))
+    stand_ins = {'crop_model': False, 'soil_model': not os.path.isdir(os.path.join(REPO, 'models', '1'))}
+    if not stand_ins['soil_model']:
+        os.symlink(os.path.join(REPO, 'models'), os.path.join(workdir, 'models'))
+    if os.path.exists(os.path.join(REPO, 'crop.pkl')):
+        shutil.copy(os.path.join(REPO, 'crop.pkl'), os.path.join(workdir, 'crop.pkl'))
+    else:
+        from sklearn.tree import DecisionTreeClassifier
+        frame = pd.read_csv(data, dtype=DATASET_DTYPES, usecols=FEATURE_COLUMNS + ['label'])
+        matrix, row_ids, _ = encode_frame(frame)
+        model = DecisionTreeClassifier(random_state=0).fit(matrix, frame['label'].to_numpy()[row_ids].astype(str))
+        with open(os.path.join(workdir, 'crop.pkl'), 'wb') as f:
+            pickle.dump(model, f)
+        stand_ins['crop_model'] = True
+    return stand_ins
+
+
+def synthetic_images(count, seed=0):
+    """JPEGs of smooth colour gradients plus noise, at a few phone-camera-like sizes."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for i in range(count):
+        width, height = IMAGE_SIZES[i % len(IMAGE_SIZES)]
+        base = rng.integers(40, 200, 3)
+        ramp = np.linspace(0, 50, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+        noise = rng.normal(0, 12, (height, width, 3)).astype(np.float32)
+        pixels = np.clip(base + ramp + noise, 0, 255).astype(np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, 'JPEG', quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+def form_rows(data):
+    frame = pd.read_csv(data)
+    return [dict(zip(FORM_FIELDS, (str(v) for v in row))) for row in frame[FEATURE_COLUMNS].itertuples(index=False)]
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('login', 'register', 'predict', 'predict_soil'):
+            raise SystemExit("Unknown endpoint in --mix: {}".format(name))
+        mix[name] = float(weight)
+    return mix
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Client(threading.Thread):
+    _names = itertools.count()
+
+    def __init__(self, base_url, mix, rows, images, stop_at, seed):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.endpoints = list(mix)
+        weights = np.array([mix[e] for e in self.endpoints])
+        self.weights = weights / weights.sum()
+        self.rows = rows
+        self.images = images
+        self.stop_at = stop_at
+        self.rng = np.random.default_rng(seed)
+        self.session = requests.Session()
+        self.records = []
+
+    def _user(self):
+        return 'loadtest{}x{}'.format(os.getpid(), next(self._names)), '9' * 10
+
+    def register(self):
+        self.name, self.mobile = self._user()
+        return self.session.post(self.base_url + '/register', allow_redirects=False,
+                                 data={'name': self.name, 'mobile_number': self.mobile})
+
+    def login(self):
+        return self.session.post(self.base_url + '/login', allow_redirects=False,
+                                 data={'name': self.name, 'mobile_number': self.mobile})
+
+    def predict(self):
+        row = self.rows[self.rng.integers(len(self.rows))]
+        return self.session.post(self.base_url + '/predict?format=json', data=row)
+
+    def predict_soil(self):
+        image = self.images[self.rng.integers(len(self.images))]
+        return self.session.post(self.base_url + '/predict_soil', files={'file': ('soil.jpg', image, 'image/jpeg')})
+
+    def call(self, endpoint):
+        started = time.perf_counter()
+        try:
+            response = getattr(self, endpoint)()
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        finished = time.perf_counter()
+        self.records.append((endpoint, started, finished - started, ok))
+
+    def run(self):
+        # Registering a fresh user keeps /register realistic; the client stays logged in as the last one
+        self.call('register')
+        self.call('login')
+        while time.perf_counter() < self.stop_at:
+            endpoint = self.endpoints[self.rng.choice(len(self.endpoints), p=self.weights)]
+            if endpoint == 'register':
+                self.call('register')
+                self.call('login')
+            else:
+                self.call(endpoint)
+        # gthread workers wait for open keep-alive connections before shutting down
+        self.session.close()
+
+
+def summarize(records, seconds):
+    latencies = np.array([r[2] for r in records]) * 1000.0
+    errors = sum(not r[3] for r in records)
+    if not len(latencies):
+        return {'requests': 0, 'errors': errors, 'req_per_s': 0.0}
+    return {
+        'requests': len(records),
+        'errors': errors,
+        'req_per_s': len(records) / seconds,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def rss_mb(master):
+    try:
+        workers = [p.memory_info().rss / 1e6 for p in master.children()]
+        return {'master': master.memory_info().rss / 1e6, 'workers': workers}
+    except psutil.Error:
+        return None
+
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("gunicorn exited with status {}".format(process.returncode))
+        try:
+            requests.get(url + '/metrics', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit("gunicorn did not come up within {}s".format(timeout))
+
+
+def start_gunicorn(workdir, workers, threads, app='load_test_app:app', worker_class=None, soil_delay_ms=0.0):
+    """Start gunicorn with the repo's config on a free port; returns ``(process, base_url)``."""
+    port = free_port()
+    env = dict(os.environ, SOIL_DB_BACKEND='sqlite', SOIL_DB_PATH=os.path.join(workdir, 'soil.db'),
+               SOIL_AUDIT_SPILL_PATH=os.path.join(workdir, 'prediction_spill.jsonl'),
+               SOIL_NEIGHBOUR_INDEX=os.path.join(workdir, 'neighbors_index'),
+               SOIL_INFERENCE_WORKERS=os.environ.get('SOIL_INFERENCE_WORKERS', '0'),
+               SOIL_LOG_LEVEL=os.environ.get('SOIL_LOG_LEVEL', 'WARNING'),
+               LOADTEST_SOIL_DELAY_MS=str(soil_delay_ms),
+               PYTHONPATH=os.pathsep.join([REPO, os.path.join(REPO, 'benchmarks')]))
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO, 'gunicorn.conf.py'),
+               '--workers', str(workers), '--threads', str(threads), '--bind', '127.0.0.1:{}'.format(port),
+               '--chdir', workdir, '--log-level', 'warning']
+    if worker_class:
+        command += ['--worker-class', worker_class]
+    process = subprocess.Popen(command + [app], env=env)
+    return process, 'http://127.0.0.1:{}'.format(port)
+
+
+def stop_gunicorn(process):
+    process.terminate()
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_config(workers, threads, args, workdir, mix, rows, images):
+    process, base_url = start_gunicorn(workdir, workers, threads, soil_delay_ms=args.soil_delay_ms)
+    try:
+        wait_until_up(base_url, process)
+        master = psutil.Process(process.pid)
+        started = time.perf_counter()
+        measure_from = started + args.warmup
+        stop_at = measure_from + args.duration
+        clients = [Client(base_url, mix, rows, images, stop_at, seed=i) for i in range(args.concurrency)]
+        for client in clients:
+            client.start()
+
+        peak = 0.0
+        while any(c.is_alive() for c in clients):
+            sample = rss_mb(master)
+            if sample:
+                peak = max(peak, sample['master'] + sum(sample['workers']))
+            time.sleep(0.5)
+        final_rss = rss_mb(master)
+
+        records = [r for c in clients for r in c.records if r[1] >= measure_from]
+        seconds = max(max((r[1] + r[2] for r in records), default=stop_at) - measure_from, 1e-9)
+        result = {'workers': workers, 'threads': threads, 'concurrency': args.concurrency, 'seconds': seconds}
+        result.update(summarize(records, seconds))
+        result['endpoints'] = {e: summarize([r for r in records if r[0] == e], seconds)
+                               for e in sorted({r[0] for r in records})}
+        result['rss_mb'] = dict(final_rss or {}, peak_total=peak)
+        return result
+    finally:
+        stop_gunicorn(process)
+
+
+def print_result(result, baseline=None):
+    line = "{workers}x{threads}: {req_per_s:.1f} req/s, p50 {p50_ms:.1f} ms, p95 {p95_ms:.1f} ms, " \
+           "p99 {p99_ms:.1f} ms, {errors} errors".format(**result)
+    if baseline:
+        line += " (baseline {:.1f} req/s {:+.1f}%, p99 {:.1f} ms)".format(
+            baseline['req_per_s'], 100.0 * (result['req_per_s'] / baseline['req_per_s'] - 1), baseline['p99_ms'])
+    print(line)
+    for name, stats in result['endpoints'].items():
+        if stats['requests']:
+            print("  {:<14} {requests:>7} req {req_per_s:>8.1f} req/s  p50 {p50_ms:>7.1f}  p95 {p95_ms:>7.1f}  "
+                  "p99 {p99_ms:>7.1f} ms  {errors} errors".format(name, **stats))
+    rss = result['rss_mb']
+    if 'workers' in rss:
+        print("  RSS MB: master {:.0f}, workers {}, peak total {:.0f}".format(
+            rss['master'], ', '.join('{:.0f}'.format(w) for w in rss['workers']), rss['peak_total']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=os.path.join(REPO, 'dataset.csv'))
+    parser.add_argument('--configs', default='1x1,2x4,4x4', help="comma separated <workers>x<threads>")
+    parser.add_argument('--duration', type=float, default=20.0, help="measured seconds per configuration")
+    parser.add_argument('--warmup', type=float, default=3.0, help="seconds of load before measuring")
+    parser.add_argument('--concurrency', type=int, default=16, help="client threads")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="endpoint weights")
+    parser.add_argument('--images', type=int, default=12, help="distinct synthetic images")
+    parser.add_argument('--soil-delay-ms', type=float, default=0.0,
+                        help="sleep added per batch by the stand-in soil model")
+    parser.add_argument('--out', default='load_test.json')
+    parser.add_argument('--baseline', default=None, help="earlier --out file to compare with")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    rows = form_rows(args.data)
+    images = synthetic_images(args.images)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {(r['workers'], r['threads']): r for r in json.load(f)['results']}
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        stand_ins = prepare_workdir(workdir, args.data)
+        for config in args.configs.split(','):
+            workers, threads = (int(n) for n in config.lower().split('x'))
+            # A fresh database per configuration, so earlier runs do not skew the next
+            for name in os.listdir(workdir):
+                if name.startswith('soil.db'):
+                    os.remove(os.path.join(workdir, name))
+            result = run_config(workers, threads, args, workdir, mix, rows, images)
+            print_result(result, baseline.get((workers, threads)))
+            results.append(result)
+
+    with open(args.out, 'w') as f:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'args': vars(args),
+            'stand_ins': stand_ins,
+            'cpu_count': os.cpu_count(),
+            'results': results,
+        }, f, indent=2)
+    print("Results written to {}".format(args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""gunicorn entry points used by the load tests: final_product with a stand-in soil model.
+
+``app`` is the Flask (WSGI) app and ``asgi_app`` the ASGI app from asgi_app.py.
+
+When ./models/1 is missing (or LOADTEST_SOIL_STAND_IN=1) the soil model is
+replaced by a deterministic projection of the pooled pixels, so the service
+can be load tested without TensorFlow or the trained SavedModel.
+LOADTEST_SOIL_DELAY_MS adds a fixed sleep per batch to mimic the real model's
+inference time.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import final_product  # noqa: E402
+from final_product import app, labels  # noqa: E402,F401
+
+
+class StandInSoilClassifier:
+    """Softmax over a fixed random projection of 8x8-pooled pixels."""
+
+    def __init__(self, seed=0, delay_ms=0.0):
+        self.weights = np.random.default_rng(seed).normal(size=(8 * 8 * 3, len(labels))).astype(np.float32)
+        self.delay = delay_ms / 1000.0
+
+    def predict(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        pooled = images.reshape(len(images), 8, 28, 8, 28, 3).mean(axis=(2, 4)).reshape(len(images), -1)
+        logits = pooled @ self.weights
+        if self.delay:
+            time.sleep(self.delay)
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+if os.environ.get('LOADTEST_SOIL_STAND_IN') == '1' or not final_product.SOIL_CLASSIFIER.discover():
+    _delay_ms = float(os.environ.get('LOADTEST_SOIL_DELAY_MS', 0))
+    final_product.SOIL_CLASSIFIER.discover = lambda: [(0, 'stand-in')]
+    final_product.SOIL_CLASSIFIER.loader = lambda path: StandInSoilClassifier(delay_ms=_delay_ms)
+
+# The load generator posts forms directly instead of scraping CSRF tokens
+app.config['WTF_CSRF_ENABLED'] = False
+
+from asgi_app import app as asgi_app  # noqa: E402,F401
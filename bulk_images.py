@@ -0,0 +1,221 @@
+"""Classify a folder or zip archive of soil photos in batches.
+
+    python bulk_images.py samples.zip [--out results.jsonl] [--batch-size 32] [--workers 4]
+                          [--processes] [--model ./models/1]
+
+Images are read in order and decoded and resized in a pool of --workers
+threads (or processes with --processes), using the same decode and resize
+steps as /predict_soil. Decoded images are normalized into a preallocated
+batch, and each full batch goes through the soil model in one call. No more
+than two batches of decoded images are held at a time. One JSON line per
+file is written as soon as its batch is done: the file name, ``class``,
+``probability`` and the probability of every label, or ``error`` for files
+that could not be read. The run ends with a summary of images/s and peak
+memory.
+
+POST /predict_soil/batch in final_product.py runs the same pipeline on an
+uploaded zip and streams the lines back.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from imaging import IMAGE_EXTENSIONS, IMAGE_SIZE, SOIL_LABELS, decode_image, resize_image, to_array
+from registry import numbered_versions, peak_rss_mb
+
+# Largest single file accepted from a folder or archive
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+# What a corrupt, truncated or non-image file raises while decoding
+DECODE_ERRORS = (OSError, ValueError, SyntaxError, Image.DecompressionBombError)
+
+# What reading a damaged (bad CRC or header), encrypted or unsupported-compression zip member raises
+ZIP_READ_ERRORS = (zipfile.BadZipFile, RuntimeError, NotImplementedError, EOFError, zlib.error)
+
+
+def decode_pixels(data):
+    """uint8 224x224x3 pixels of an image file, decoded and resized like read_file_as_image."""
+    return np.asarray(resize_image(decode_image(data)))
+
+
+def is_image_name(name):
+    base = os.path.basename(name)
+    return base.lower().endswith(IMAGE_EXTENSIONS) and not base.startswith('._') and '__MACOSX/' not in name
+
+
+def iter_zip(archive, max_bytes=MAX_IMAGE_BYTES):
+    """``(name, bytes)`` for each image in an open ZipFile.
+
+    ``bytes`` is None when over ``max_bytes``, and the exception instead when
+    the member cannot be read, so one bad entry does not end the run.
+    """
+    for info in archive.infolist():
+        if info.is_dir() or not is_image_name(info.filename):
+            continue
+        # file_size comes from the archive's directory, so an oversized entry is never inflated
+        if info.file_size > max_bytes:
+            yield info.filename, None
+            continue
+        try:
+            data = archive.read(info)
+        except ZIP_READ_ERRORS as exc:
+            data = exc
+        yield info.filename, data
+
+
+def iter_folder(folder, max_bytes=MAX_IMAGE_BYTES):
+    """``(relative path, bytes)`` for each image under ``folder``, in sorted order."""
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if not is_image_name(path):
+                continue
+            relative = os.path.relpath(path, folder)
+            if os.path.getsize(path) > max_bytes:
+                yield relative, None
+                continue
+            with open(path, 'rb') as f:
+                yield relative, f.read()
+
+
+def classify_images(items, predict, executor, batch_size=32, labels=SOIL_LABELS):
+    """Yield one result dict per ``(name, bytes)`` item, in input order.
+
+    ``bytes`` may also be None (file over MAX_IMAGE_BYTES) or the exception
+    raised reading the file, as ``iter_zip`` yields them; both become errors.
+    ``executor`` decodes up to two batches ahead of the model, and
+    ``predict`` is called with float32 ``[n, 224, 224, 3]`` batches of at
+    most ``batch_size`` images.
+    """
+    batch = np.empty((batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+    waiting = []  # (name, slot in batch or None, error) since the last model call
+    filled = 0
+
+    def flush():
+        probabilities = predict(batch[:filled]) if filled else None
+        for name, slot, error in waiting:
+            if slot is None:
+                yield {'file': name, 'error': error}
+                continue
+            row = probabilities[slot]
+            best = int(row.argmax())
+            yield {'file': name, 'class': labels[best], 'probability': float(row[best]),
+                   'probabilities': dict(zip(labels, row.tolist()))}
+        del waiting[:]
+
+    def collect(name, future):
+        nonlocal filled
+        if future is None:
+            waiting.append((name, None, "larger than {} bytes".format(MAX_IMAGE_BYTES)))
+            return
+        if isinstance(future, Exception):
+            waiting.append((name, None, "could not read file: {}".format(future)))
+            return
+        try:
+            pixels = future.result()
+        except Image.UnidentifiedImageError:
+            waiting.append((name, None, "not a recognized image format"))
+            return
+        except DECODE_ERRORS as exc:
+            waiting.append((name, None, "could not decode image: {}".format(exc)))
+            return
+        to_array(pixels, out=batch[filled])
+        waiting.append((name, filled, None))
+        filled += 1
+
+    pending = deque()
+    for name, data in items:
+        pending.append((name, executor.submit(decode_pixels, data) if isinstance(data, bytes) else data))
+        while len(pending) > 2 * batch_size or (pending and isinstance(pending[0][1], Future)
+                                                and pending[0][1].done()):
+            collect(*pending.popleft())
+            if filled == batch_size:
+                yield from flush()
+                filled = 0
+    while pending:
+        collect(*pending.popleft())
+        if filled == batch_size:
+            yield from flush()
+            filled = 0
+    yield from flush()
+
+
+def make_executor(workers, processes=False):
+    if processes:
+        return ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn'))
+    return ThreadPoolExecutor(workers, thread_name_prefix='decode')
+
+
+def default_model_dir():
+    # Same lookup as the server: the newest ./models/<n>
+    versions = numbered_versions(os.environ.get('SOIL_MODEL_DIR', './models'))()
+    return versions[-1][1] if versions else './models/1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help="folder or zip archive of images")
+    parser.add_argument('--out', default='-', help="JSON lines output (default: stdout)")
+    parser.add_argument('--model', default=None, help="soil model directory (default: as the server picks it)")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="decode threads or processes")
+    parser.add_argument('--processes', action='store_true', help="decode in processes instead of threads")
+    args = parser.parse_args()
+
+    from soil_model import load_soil_classifier
+
+    classifier = load_soil_classifier(args.model or default_model_dir())
+    out = sys.stdout if args.out == '-' else open(args.out, 'w')
+    count = errors = 0
+    model_seconds = 0.0
+
+    def predict(images):
+        nonlocal model_seconds
+        started = time.perf_counter()
+        probabilities = classifier.predict(images)
+        model_seconds += time.perf_counter() - started
+        return probabilities
+
+    started = time.perf_counter()
+    executor = make_executor(args.workers, args.processes)
+    try:
+        if os.path.isdir(args.source):
+            items = iter_folder(args.source)
+            archive = None
+        else:
+            archive = zipfile.ZipFile(args.source)
+            items = iter_zip(archive)
+        for result in classify_images(items, predict, executor, args.batch_size):
+            out.write(json.dumps(result) + '\n')
+            count += 1
+            errors += 'error' in result
+        if archive is not None:
+            archive.close()
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if out is not sys.stdout:
+            out.close()
+    seconds = time.perf_counter() - started
+
+    own, workers = peak_rss_mb()
+    memory = "peak RSS {:.0f} MB".format(own)
+    if args.processes:
+        memory += " (largest decode process {:.0f} MB)".format(workers)
+    print("Classified {} images ({} errors) in {:.1f}s, {:.1f} images/s ({:.1f}s in the model); {}".format(
+        count, errors, seconds, count / seconds if seconds else float('inf'), model_seconds, memory),
+        file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
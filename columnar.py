@@ -0,0 +1,114 @@
+"""Compact, memory-mapped columnar copy of dataset.csv-style data.
+
+    python columnar.py convert dataset.csv dataset_columnar [--chunksize 1000000]
+
+Each column is stored as a raw little-endian array in its own file (int16
+for N/P/K, float32 for the climate columns, int8 codes for soil and int16
+codes for label) next to a meta.json holding the row count, dtypes and the
+label categories. ``ColumnarDataset`` memory-maps those files, so callers
+can slice rows without parsing text or loading the whole dataset.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from features import DATASET_DTYPES, FEATURE_COLUMNS, SOIL_CODES, encode_frame
+
+COLUMN_DTYPES = {
+    'N': '<i2', 'P': '<i2', 'K': '<i2',
+    'temperature': '<f4', 'humidity': '<f4', 'ph': '<f4', 'rainfall': '<f4',
+    'soil': '<i1', 'label': '<i2',
+}
+
+
+def is_columnar(path):
+    return os.path.isfile(os.path.join(path, 'meta.json'))
+
+
+def convert(csv_path, out_dir, chunksize=1000000):
+    """Stream ``csv_path`` into the columnar layout; returns ``(rows, dropped)``.
+
+    Rows that fail the /predict validation rules are dropped, so the stored
+    soil codes and value ranges are exactly what the models are trained on.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    files = {name: open(os.path.join(out_dir, name + '.bin'), 'wb') for name in COLUMN_DTYPES}
+    labels = {}
+    rows = dropped = 0
+    try:
+        reader = pd.read_csv(csv_path, dtype=DATASET_DTYPES, usecols=FEATURE_COLUMNS + ['label'],
+                             chunksize=chunksize)
+        for chunk in reader:
+            matrix, row_ids, errors = encode_frame(chunk)
+            dropped += len(errors)
+            for i, name in enumerate(FEATURE_COLUMNS):
+                files[name].write(matrix[:, i].astype(COLUMN_DTYPES[name]).tobytes())
+            chunk_labels = chunk['label'].astype(str).to_numpy()[row_ids]
+            uniques, inverse = np.unique(chunk_labels, return_inverse=True)
+            codes = np.array([labels.setdefault(label, len(labels)) for label in uniques.tolist()], dtype='<i2')
+            files['label'].write(codes[inverse].tobytes())
+            rows += len(row_ids)
+    finally:
+        for f in files.values():
+            f.close()
+
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump({'rows': rows, 'dtypes': COLUMN_DTYPES, 'soil_codes': SOIL_CODES,
+                   'labels': sorted(labels, key=labels.get)}, f, indent=2)
+    return rows, dropped
+
+
+class ColumnarDataset:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.label_names = np.array(self.meta['labels'])
+        self.columns = {}
+        for name, dtype in self.meta['dtypes'].items():
+            file_path = os.path.join(path, name + '.bin')
+            if self.meta['rows']:
+                self.columns[name] = np.memmap(file_path, dtype=dtype, mode='r', shape=(self.meta['rows'],))
+            else:
+                self.columns[name] = np.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def features(self, start=0, stop=None, dtype=np.float64):
+        """Encoded feature matrix (FEATURE_COLUMNS order) for rows ``start:stop``."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        out = np.empty((max(stop - start, 0), len(FEATURE_COLUMNS)), dtype=dtype)
+        for i, name in enumerate(FEATURE_COLUMNS):
+            out[:, i] = self.columns[name][start:stop]
+        return out
+
+    def label_codes(self, start=0, stop=None):
+        return np.asarray(self.columns['label'][start:stop])
+
+    def labels(self, start=0, stop=None):
+        return self.label_names[self.label_codes(start, stop)]
+
+    def iter_batches(self, batch_size=100000):
+        for start in range(0, len(self), batch_size):
+            yield self.features(start, start + batch_size), self.labels(start, start + batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    conv = sub.add_parser('convert', help="convert a dataset.csv-style file")
+    conv.add_argument('csv')
+    conv.add_argument('out')
+    conv.add_argument('--chunksize', type=int, default=1000000)
+    args = parser.parse_args()
+
+    rows, dropped = convert(args.csv, args.out, args.chunksize)
+    print("Wrote {} rows to {} ({} invalid rows dropped)".format(rows, args.out, dropped))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Oracle style positional binds (:1, :2, ...) rewritten for SQLite (?1, ?2, ...)
+_ORACLE_BIND = re.compile(r':(\d+)')
+
+# id and created_at give GET /history a stable newest-first order (see history.py). created_at is
+# the UTC prediction time sent by the audit queue; the default only covers rows inserted without one.
+# inserted_at is always set by the database and is what the rollup settle window looks at (rollups.py)
+SQLITE_PREDICTION_TABLE = """
+CREATE TABLE IF NOT EXISTS prediction (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR(50),
+    mobile_number VARCHAR(255),
+    N INTEGER,
+    P INTEGER,
+    K INTEGER,
+    temperature REAL,
+    humidity REAL,
+    ph REAL,
+    rainfall REAL,
+    soil VARCHAR(20),
+    predicted_crop VARCHAR(50),
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    inserted_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+"""
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    name VARCHAR(50) PRIMARY KEY,
+    mobile_number VARCHAR(255) NOT NULL
+);
+""" + SQLITE_PREDICTION_TABLE
+
+# Monthly crop x soil aggregates kept up to date by rollups.py, the SQLite version of prediction_rollups.sql
+SQLITE_ROLLUPS = """
+CREATE TABLE IF NOT EXISTS crop_soil_monthly (
+    period VARCHAR(7) NOT NULL,
+    soil VARCHAR(20) NOT NULL,
+    predicted_crop VARCHAR(50) NOT NULL,
+    predictions INTEGER NOT NULL,
+    sum_n REAL NOT NULL,
+    sum_p REAL NOT NULL,
+    sum_k REAL NOT NULL,
+    sum_temperature REAL NOT NULL,
+    sum_humidity REAL NOT NULL,
+    sum_ph REAL NOT NULL,
+    sum_rainfall REAL NOT NULL,
+    PRIMARY KEY (period, soil, predicted_crop)
+);
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name VARCHAR(50) PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO rollup_state (name, last_id) VALUES ('crop_soil_monthly', 0);
+"""
+
+# Indexes behind GET /history, the SQLite version of prediction_history.sql
+SQLITE_INDEXES = """
+CREATE INDEX IF NOT EXISTS prediction_name_created ON prediction (name, created_at, id);
+CREATE INDEX IF NOT EXISTS prediction_name_crop_created ON prediction (name, predicted_crop, created_at, id);
+CREATE INDEX IF NOT EXISTS prediction_name_soil_created ON prediction (name, soil, created_at, id);
+"""
+
+_PREDICTION_COLUMNS = ['id', 'name', 'mobile_number', 'N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall',
+                       'soil', 'predicted_crop', 'created_at', 'inserted_at']
+
+
+def sqlite_migrate_prediction(columns):
+    """Rebuild an older prediction table in the current layout.
+
+    Columns the old table already has are copied (ids included, so the rollup
+    watermark stays valid); missing ones get their defaults, i.e. the
+    migration time for created_at and inserted_at.
+    """
+    kept = ', '.join(c for c in _PREDICTION_COLUMNS if c in columns)
+    return ("ALTER TABLE prediction RENAME TO prediction_old;" + SQLITE_PREDICTION_TABLE
+            + "INSERT INTO prediction ({0}) SELECT {0} FROM prediction_old ORDER BY rowid;".format(kept)
+            + "DROP TABLE prediction_old;")
+
+
+class _PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquires = 0
+        self.acquire_wait = 0.0
+        self.acquire_wait_max = 0.0
+        self.errors = 0
+        self.reconnects = 0
+
+    def record_acquire(self, waited):
+        with self.lock:
+            self.acquires += 1
+            self.acquire_wait += waited
+            self.acquire_wait_max = max(self.acquire_wait_max, waited)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'acquires': self.acquires,
+                'mean_acquire_ms': self.acquire_wait * 1000.0 / self.acquires if self.acquires else 0.0,
+                'max_acquire_ms': self.acquire_wait_max * 1000.0,
+                'errors': self.errors,
+                'reconnects': self.reconnects,
+            }
+
+
+class OraclePool:
+    """cx_Oracle session pool handing out one connection per request.
+
+    Idle sessions are pinged on acquire (``ping_interval``) and dead ones are
+    dropped from the pool instead of being released back into it. If the pool
+    itself cannot hand out a session (e.g. the database restarted) it is
+    recreated once before the error is raised to the caller.
+    """
+
+    dialect = 'oracle'
+
+    def __init__(self, user, password, dsn, min=2, max=8, increment=1, ping_interval=60):
+        import cx_Oracle
+        self._cx = cx_Oracle
+        self._params = dict(user=user, password=password, dsn=dsn, min=min, max=max, increment=increment)
+        self.ping_interval = ping_interval
+        self._lock = threading.Lock()
+        self._stats = _PoolStats()
+        self._pool = self._create()
+
+    def _create(self):
+        pool = self._cx.SessionPool(threaded=True, getmode=self._cx.SPOOL_ATTRVAL_WAIT, encoding="UTF-8",
+                                    **self._params)
+        pool.ping_interval = self.ping_interval
+        return pool
+
+    def _reconnect(self, broken):
+        with self._lock:
+            # Another thread may already have replaced the pool
+            if self._pool is broken:
+                try:
+                    broken.close(force=True)
+                except self._cx.Error:
+                    pass
+                self._pool = self._create()
+                self._stats.reconnects += 1
+            return self._pool
+
+    def _acquire(self):
+        pool = self._pool
+        started = time.perf_counter()
+        try:
+            conn = pool.acquire()
+        except self._cx.DatabaseError:
+            self._stats.errors += 1
+            pool = self._reconnect(pool)
+            conn = pool.acquire()
+        self._stats.record_acquire(time.perf_counter() - started)
+        return pool, conn
+
+    @contextmanager
+    def connection(self):
+        pool, conn = self._acquire()
+        try:
+            yield conn
+        except self._cx.DatabaseError:
+            self._stats.errors += 1
+            # The session may be dead; do not hand it to the next request
+            pool.drop(conn)
+            raise
+        except BaseException:
+            conn.rollback()
+            pool.release(conn)
+            raise
+        else:
+            pool.release(conn)
+
+    def ping(self):
+        try:
+            with self.connection() as conn:
+                conn.ping()
+            return True
+        except self._cx.DatabaseError:
+            return False
+
+    def stats(self):
+        pool = self._pool
+        stats = {
+            'backend': 'oracle',
+            'min': pool.min,
+            'max': pool.max,
+            'increment': pool.increment,
+            'opened': pool.opened,
+            'busy': pool.busy,
+        }
+        stats.update(self._stats.as_dict())
+        return stats
+
+    def close(self):
+        self._pool.close(force=True)
+
+
+class _SqliteCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.arraysize = 100
+
+    def execute(self, query, params=()):
+        self._cursor.execute(_ORACLE_BIND.sub(r'?\1', query), params)
+        return self
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(_ORACLE_BIND.sub(r'?\1', query), rows)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class _SqliteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return _SqliteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self):
+        self._conn.execute("SELECT 1")
+
+
+class SqlitePool:
+    """Drop-in stand-in for ``OraclePool`` backed by SQLite, for local runs and load tests.
+
+    Accepts the Oracle ``:1`` bind style used across the app and creates the
+    ``users`` and ``prediction`` tables on first use.
+    """
+
+    dialect = 'sqlite'
+
+    def __init__(self, path="soil.db", max=8):
+        self.path = path
+        self.max = max
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._stats = _PoolStats()
+        with self.connection() as conn:
+            conn._conn.executescript(SQLITE_SCHEMA)
+            columns = [row[1] for row in conn._conn.execute("PRAGMA table_info(prediction)")]
+            if 'created_at' not in columns or 'inserted_at' not in columns:
+                conn._conn.executescript("BEGIN;" + sqlite_migrate_prediction(columns) + "COMMIT;")
+            conn._conn.executescript(SQLITE_INDEXES)
+            conn._conn.executescript(SQLITE_ROLLUPS)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return _SqliteConnection(conn)
+
+    @contextmanager
+    def connection(self):
+        started = time.perf_counter()
+        with self._lock:
+            create = self._idle.empty() and self._opened < self.max
+            if create:
+                self._opened += 1
+        conn = self._connect() if create else self._idle.get()
+        with self._lock:
+            self._busy += 1
+        self._stats.record_acquire(time.perf_counter() - started)
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            with self._lock:
+                self._busy -= 1
+            self._idle.put(conn)
+
+    def ping(self):
+        try:
+            with self.connection() as conn:
+                conn.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def stats(self):
+        with self._lock:
+            stats = {'backend': 'sqlite', 'path': self.path, 'max': self.max,
+                     'opened': self._opened, 'busy': self._busy}
+        stats.update(self._stats.as_dict())
+        return stats
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get()._conn.close()
+
+
+def create_pool():
+    """Build the pool configured by the SOIL_DB_* environment variables."""
+    if os.environ.get('SOIL_DB_BACKEND', 'oracle') == 'sqlite':
+        return SqlitePool(os.environ.get('SOIL_DB_PATH', 'soil.db'),
+                          max=int(os.environ.get('SOIL_DB_POOL_MAX', 8)))
+
+    import cx_Oracle
+    dsn_tns = cx_Oracle.makedsn(os.environ.get('SOIL_DB_HOST', 'DESKTOP-JRAAC71'),
+                                int(os.environ.get('SOIL_DB_PORT', 1521)),
+                                service_name=os.environ.get('SOIL_DB_SERVICE', 'XE'))
+    return OraclePool(os.environ.get('SOIL_DB_USER', 'system'),
+                      os.environ.get('SOIL_DB_PASSWORD', 'saicharan'),
+                      dsn_tns,
+                      min=int(os.environ.get('SOIL_DB_POOL_MIN', 2)),
+                      max=int(os.environ.get('SOIL_DB_POOL_MAX', 8)),
+                      increment=int(os.environ.get('SOIL_DB_POOL_INCREMENT', 1)))
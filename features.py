@@ -0,0 +1,225 @@
+import math
+import numbers
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+# Column layout of dataset.csv (minus the label) and the order the crop model expects
+FEATURE_COLUMNS = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall', 'soil']
+NUMERIC_COLUMNS = FEATURE_COLUMNS[:-1]
+_PH, _TEMPERATURE, _HUMIDITY = (FEATURE_COLUMNS.index(c) for c in ('ph', 'temperature', 'humidity'))
+
+# Field names used by the /predict HTML form, in FEATURE_COLUMNS order
+FORM_FIELDS = ['Nitrogen', 'Phosphorus', 'Potassium', 'Temperature', 'Humidity', 'pH', 'Rainfall', 'Soil']
+
+# Encoding for the "soil" attribute
+SOIL_CODES = {'Alluvial': 0, 'Black': 1, 'Clay': 2, 'Red': 3}
+
+# Validation messages shared by the row and the column-wise encoders
+PH_ERROR = "ph must be in (0, 14]"
+TEMPERATURE_ERROR = "temperature must be in (0, 60)"
+HUMIDITY_ERROR = "humidity must be positive"
+SOIL_ERROR = "soil must be one of {}".format(", ".join(SOIL_CODES))
+RECORD_ERROR = "expected an object with {}"
+
+# Explicit dtypes for reading dataset.csv-style files without type inference.
+# N, P and K are whole numbers but read as floats so blank cells become NaN.
+DATASET_DTYPES = {
+    'N': 'float32', 'P': 'float32', 'K': 'float32',
+    'temperature': 'float32', 'humidity': 'float32', 'ph': 'float32', 'rainfall': 'float32',
+    'soil': 'category', 'label': 'category',
+}
+
+
+def parse_number(value):
+    """``value`` as a float, or NaN when it is not a number or a numeric string.
+
+    The one parser behind both encoders, so a value is accepted or rejected
+    the same way whichever path handles it. Surrounding whitespace is
+    ignored; booleans, digit separators ("1_000") and non-ASCII digits are
+    not numbers.
+    """
+    if isinstance(value, str):
+        value = value.strip()
+        if '_' in value or not value.isascii():
+            return math.nan
+    elif isinstance(value, bool) or not isinstance(value, numbers.Real):
+        return math.nan
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def encode_frame(frame):
+    """Validate and soil-encode a DataFrame laid out like dataset.csv.
+
+    Every rule from the /predict form is checked column-wise, so a batch is
+    validated in a handful of NumPy operations instead of one Python branch
+    per row. Returns ``(matrix, row_ids, errors)`` where ``matrix`` holds only
+    the valid rows as float64, ``row_ids`` are their positions in ``frame``
+    and ``errors`` is a list of ``{"row", "error"}`` dicts for the rest.
+    """
+    n_rows = len(frame)
+    matrix = np.empty((n_rows, len(FEATURE_COLUMNS)), dtype=np.float64)
+    invalid = np.zeros(n_rows, dtype=bool)
+    problems = {}
+
+    for i, column in enumerate(NUMERIC_COLUMNS):
+        if column in frame and is_numeric_dtype(frame[column]) and not is_bool_dtype(frame[column]):
+            values = frame[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        elif column in frame:
+            # Strings and mixed JSON values go through the same parser as FeatureEncoder
+            values = frame[column].map(parse_number).to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            values = np.full(n_rows, np.nan)
+        matrix[:, i] = values
+        # inf parses as a number but the model cannot take it, so it counts as missing too
+        missing = ~np.isfinite(values)
+        invalid |= missing
+        for row in np.flatnonzero(missing):
+            problems.setdefault(row, []).append("missing or non-numeric '{}'".format(column))
+
+    if 'soil' in frame:
+        try:
+            soil = frame['soil'].map(SOIL_CODES)
+        except TypeError:
+            # Unhashable cells (lists, objects from JSON) cannot be looked up in the mapping
+            soil = frame['soil'].map(lambda value: SOIL_CODES.get(value) if isinstance(value, str) else None)
+        soil = soil.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        soil = np.full(n_rows, np.nan)
+    matrix[:, -1] = soil
+
+    # Validation for pH, temperature, humidity, and soil (same rules as the form)
+    ph = matrix[:, _PH]
+    temp = matrix[:, _TEMPERATURE]
+    humidity = matrix[:, _HUMIDITY]
+    with np.errstate(invalid='ignore'):
+        checks = [
+            (np.isfinite(ph) & ~((ph > 0) & (ph <= 14)), PH_ERROR),
+            (np.isfinite(temp) & ~((temp > 0) & (temp < 60)), TEMPERATURE_ERROR),
+            (np.isfinite(humidity) & ~(humidity > 0), HUMIDITY_ERROR),
+            (np.isnan(soil), SOIL_ERROR),
+        ]
+    for failed, message in checks:
+        invalid |= failed
+        for row in np.flatnonzero(failed):
+            problems.setdefault(row, []).append(message)
+
+    valid = ~invalid
+    errors = [{'row': int(row), 'error': "; ".join(problems[row])} for row in np.flatnonzero(invalid)]
+    # N, P and K are integers on the form
+    matrix[:, :3] = np.trunc(matrix[:, :3])
+    return matrix[valid], np.flatnonzero(valid), errors
+
+
+def encode_record_frame(records):
+    """``encode_frame`` for a list of JSON records, for batches too big to encode row by row.
+
+    Records that are not objects get the same row error as
+    ``FeatureEncoder.encode_records`` instead of breaking the DataFrame.
+    Row ids and errors refer to positions in ``records``.
+    """
+    positions = [i for i, record in enumerate(records) if isinstance(record, dict)]
+    matrix, row_ids, errors = encode_frame(pd.DataFrame.from_records([records[i] for i in positions]))
+    positions = np.asarray(positions, dtype=np.int64)
+    errors = [{'row': int(positions[e['row']]), 'error': e['error']} for e in errors]
+    if len(positions) < len(records):
+        message = RECORD_ERROR.format(", ".join(FEATURE_COLUMNS))
+        skipped = np.setdiff1d(np.arange(len(records)), positions)
+        errors = sorted(errors + [{'row': int(row), 'error': message} for row in skipped], key=lambda e: e['row'])
+    return matrix, positions[row_ids], errors
+
+
+class InvalidFeatures(ValueError):
+    """Raised by FeatureEncoder when a sample breaks the /predict validation rules."""
+
+
+class FeatureEncoder:
+    """Parse and validate raw inputs straight into float32 feature rows.
+
+    The per-request path for the form and JSON routes: fields are parsed with
+    ``parse_number`` and written into a preallocated row (or a row of a batch
+    matrix) without building a DataFrame. The rules and soil encoding are
+    the same as ``encode_frame``, which handles large tabular inputs.
+    ``fields`` maps FEATURE_COLUMNS to the input's key names, e.g.
+    ``FORM_FIELDS`` for the HTML form.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = list(fields or FEATURE_COLUMNS)
+
+    def encode(self, values, out=None):
+        """Encode one mapping into ``out`` (a new float32 row by default).
+
+        Raises ``InvalidFeatures`` listing every problem with the sample.
+        """
+        problems = []
+        missing = set()
+        parsed = []
+        for i, column in enumerate(NUMERIC_COLUMNS):
+            try:
+                value = parse_number(values[self.fields[i]])
+            except (KeyError, TypeError):
+                value = math.nan
+            if not math.isfinite(value):
+                missing.add(column)
+                problems.append("missing or non-numeric '{}'".format(column))
+            parsed.append(value)
+
+        # Validation for pH, temperature, humidity, and soil
+        ph, temp, humidity = parsed[_PH], parsed[_TEMPERATURE], parsed[_HUMIDITY]
+        if 'ph' not in missing and not 0 < ph <= 14:
+            problems.append(PH_ERROR)
+        if 'temperature' not in missing and not 0 < temp < 60:
+            problems.append(TEMPERATURE_ERROR)
+        if 'humidity' not in missing and not humidity > 0:
+            problems.append(HUMIDITY_ERROR)
+        soil = values.get(self.fields[-1]) if hasattr(values, 'get') else None
+        soil = SOIL_CODES.get(soil) if isinstance(soil, str) else None
+        if soil is None:
+            problems.append(SOIL_ERROR)
+        if problems:
+            raise InvalidFeatures("; ".join(problems))
+
+        # N, P and K are integers on the form
+        parsed[0], parsed[1], parsed[2] = math.trunc(parsed[0]), math.trunc(parsed[1]), math.trunc(parsed[2])
+        parsed.append(soil)
+        if out is None:
+            return np.array(parsed, dtype=np.float32)
+        out[:] = parsed
+        return out
+
+    def encode_records(self, records, out=None):
+        """Encode a list of mappings into one float64 matrix.
+
+        Returns ``(matrix, row_ids, errors)`` like ``encode_frame``, with the
+        same dtype, so a batch scores the same whichever encoder handled it.
+        """
+        if out is None:
+            out = np.empty((len(records), len(FEATURE_COLUMNS)), dtype=np.float64)
+        valid = np.ones(len(records), dtype=bool)
+        errors = []
+        for i, record in enumerate(records):
+            try:
+                if not isinstance(record, dict):
+                    raise InvalidFeatures(RECORD_ERROR.format(", ".join(self.fields)))
+                self.encode(record, out[i])
+            except InvalidFeatures as exc:
+                valid[i] = False
+                errors.append({'row': i, 'error': str(exc)})
+        return out[valid], np.flatnonzero(valid), errors
+
+
+def model_input(matrix, model):
+    """Wrap ``matrix`` in a DataFrame only for models fitted on named columns.
+
+    Estimators fitted on a DataFrame warn when handed a bare array, so legacy
+    pickles get the column names back; models trained by train.py are fitted
+    on arrays and take the matrix as is.
+    """
+    if hasattr(model, 'feature_names_in_'):
+        return pd.DataFrame(matrix, columns=list(model.feature_names_in_))
+    return matrix
@@ -1,24 +1,176 @@
 
-from flask import Flask, render_template, redirect, url_for, request, jsonify
-import cx_Oracle
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, render_template, redirect, url_for, request, jsonify, stream_with_context
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField
 from wtforms.validators import InputRequired, Length
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 import numpy as np
 from io import BytesIO
-from PIL import Image
-import tensorflow as tf
 import pandas as pd
-import pickle
+import json
+import tempfile
+import zipfile
+from features import (FEATURE_COLUMNS, FORM_FIELDS, SOIL_CODES, FeatureEncoder, InvalidFeatures, encode_frame,
+                      encode_record_frame, model_input)
+from batching import MicroBatcher
+from imaging import SOIL_FORM_VALUES, SOIL_LABELS, decode_image, resize_image, to_array
+from bulk_images import DECODE_ERRORS, classify_images, iter_zip, make_executor
+from inference_pool import InferencePool, InferenceTimeout, PoolSaturated, WorkerExited
+from db import create_pool
+from audit import PredictionAuditQueue, predicted_at
+from cache import LRUCache
+from recommendation import RecommendationCache, parse_quantization, rank_rows
+from neighbors import NeighbourIndex, load_training_rows
+from history import InvalidHistoryQuery, fetch_page, iter_history, parse_filters
+from rollups import load_views
+from registry import ModelRegistry, file_versions, load_crop_model, numbered_versions
+from resources import LazyResource, record_phase, startup_report
+from metrics import CONTENT_TYPE, MetricsRegistry, instrument_app
+from logs import configure_logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+import atexit
+import logging
+import os
+
+record_phase('imports', time.perf_counter() - _import_started)
+
+# SOIL_EAGER_LOAD=1 loads every model and the DB pool up front (see warm_up / gunicorn.conf.py)
+EAGER_LOAD = os.environ.get('SOIL_EAGER_LOAD', '0') == '1'
 
 app = Flask(__name__)
 app.secret_key = 'its_a_secret'
 
-MODEL = tf.keras.models.load_model("./models/1")
-labels = ["Alluvial_Soil", "Black_Soil", "Clay_Soil", "Red_Soil"]
-
-loaded_model = pickle.load(open('crop.pkl', 'rb'))
+# Leveled, sampled JSON logs (see logs.py); per-request details are logged at DEBUG
+log = configure_logging()
+
+# Request counts and latencies per route, plus per-stage timings of the prediction routes
+METRICS = MetricsRegistry()
+HTTP_REQUESTS, HTTP_LATENCY = instrument_app(app, METRICS)
+STAGE_SECONDS = METRICS.histogram('soil_stage_duration_seconds', "Time spent in each stage of a prediction",
+                                  ('route', 'stage'))
+
+def _load_soil_classifier(path):
+    # TensorFlow is only imported once an image route actually needs the model
+    started = time.perf_counter()
+    from soil_model import load_soil_classifier
+    record_phase('tensorflow_import', time.perf_counter() - started)
+    # Traced (or the TFLite interpreter allocated) once with a warmup call
+    return load_soil_classifier(path)
+
+def _warm_up_crop_model(model):
+    model.predict(model_input(np.zeros((1, len(FEATURE_COLUMNS)), dtype=np.float32), model))
+
+# Versioned models are watched and hot-swapped without restarting workers (see registry.py).
+# The soil model lives in ./models/<n>; crop models in ./crop_models/<n>/crop.pkl when that
+# directory exists, otherwise crop.pkl is reloaded whenever its modification time changes.
+MODEL_POLL_SECONDS = float(os.environ.get('SOIL_MODEL_POLL_SECONDS', 30))
+_soil_model_dir = os.environ.get('SOIL_MODEL_DIR', './models')
+# SOIL_MODEL_VARIANT=<name> serves ./models/variants/<name>/<n> as exported by soil_variants.py
+if os.environ.get('SOIL_MODEL_VARIANT'):
+    _soil_model_dir = os.path.join(_soil_model_dir, 'variants', os.environ['SOIL_MODEL_VARIANT'])
+SOIL_CLASSIFIER = ModelRegistry('soil_model', numbered_versions(_soil_model_dir),
+                                _load_soil_classifier, poll_interval=MODEL_POLL_SECONDS)
+_crop_model_dir = os.environ.get('SOIL_CROP_MODEL_DIR', './crop_models')
+_crop_spec = ('numbered', _crop_model_dir, 'crop.pkl') if os.path.isdir(_crop_model_dir) else ('file', 'crop.pkl')
+CROP_MODEL = ModelRegistry('crop_model',
+                           numbered_versions(*_crop_spec[1:]) if _crop_spec[0] == 'numbered'
+                           else file_versions('crop.pkl'),
+                           load_crop_model, warmup=_warm_up_crop_model, poll_interval=MODEL_POLL_SECONDS)
+labels = list(SOIL_LABELS)
+
+# Concurrent image requests are coalesced into one forward pass
+SOIL_BATCHER = MicroBatcher(
+    lambda batch: SOIL_CLASSIFIER.get().predict(batch),
+    max_batch_size=int(os.environ.get('SOIL_BATCH_MAX_SIZE', 16)),
+    max_wait_ms=float(os.environ.get('SOIL_BATCH_WINDOW_MS', 10)),
+)
+
+# SOIL_INFERENCE_WORKERS > 0 moves inference into that many model-holding processes
+# (see inference_pool.py). The in-process models above are still used when the pool is
+# saturated, and the crop model copy here also keys the recommendation cache.
+_inference_workers = int(os.environ.get('SOIL_INFERENCE_WORKERS', 0))
+INFERENCE_POOL = InferencePool(
+    size=_inference_workers,
+    soil_spec=('numbered', _soil_model_dir),
+    crop_spec=_crop_spec,
+    slots=int(os.environ.get('SOIL_INFERENCE_SLOTS', 0)) or None,
+    max_pending=int(os.environ.get('SOIL_INFERENCE_MAX_PENDING', 256)),
+    timeout=float(os.environ.get('SOIL_INFERENCE_TIMEOUT', 5.0)),
+    max_batch_size=int(os.environ.get('SOIL_BATCH_MAX_SIZE', 16)),
+    poll_interval=MODEL_POLL_SECONDS,
+) if _inference_workers > 0 else None
+if INFERENCE_POOL is not None:
+    atexit.register(INFERENCE_POOL.close)
+
+def classify_soil(data, route):
+    """Soil class probabilities for the bytes of an uploaded image, timing each stage."""
+    with STAGE_SECONDS.time(route=route, stage='decode'):
+        image = decode_image(data)
+    with STAGE_SECONDS.time(route=route, stage='resize'):
+        image = resize_image(image)
+    with STAGE_SECONDS.time(route=route, stage='model'):
+        if INFERENCE_POOL is not None:
+            try:
+                return INFERENCE_POOL.classify_image(image)
+            except (PoolSaturated, WorkerExited):
+                pass  # counted in the pool stats; degrade to in-process inference
+        return SOIL_BATCHER.predict(to_array(image))
+
+# /predict_soil/batch decodes archive members on these threads and classifies them in batches
+BULK_BATCH_SIZE = int(os.environ.get('SOIL_BULK_BATCH_SIZE', 32))
+BULK_DECODE_EXECUTOR = make_executor(int(os.environ.get('SOIL_BULK_DECODE_THREADS', os.cpu_count() or 4)))
+
+# /predict/combined classifies the image on one of these threads while the crop model runs
+COMBINED_EXECUTOR = ThreadPoolExecutor(int(os.environ.get('SOIL_COMBINED_THREADS', 8)), thread_name_prefix='combined')
+
+def rank_crops(model, matrix, k):
+    """``rank_rows`` run in the inference pool when it is enabled and has room."""
+    if INFERENCE_POOL is not None:
+        try:
+            crops, scores = INFERENCE_POOL.rank_crops(matrix, k)
+            return [list(zip(c, s)) for c, s in zip(crops.tolist(), scores.tolist())]
+        except (PoolSaturated, WorkerExited):
+            pass
+    return rank_rows(model, matrix, k)
+
+# Each worker keeps at most this many of its latest predictions searchable on top of the index
+NEIGHBOUR_MAX_DELTA = int(os.environ.get('SOIL_NEIGHBOUR_MAX_DELTA', 1000))
+if NEIGHBOUR_MAX_DELTA < 0:
+    raise ValueError("SOIL_NEIGHBOUR_MAX_DELTA must be zero or positive, got {}".format(NEIGHBOUR_MAX_DELTA))
+
+def _load_neighbour_index():
+    path = os.environ.get('SOIL_NEIGHBOUR_INDEX', 'neighbors_index')
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        return NeighbourIndex.open(path, persist=False, max_delta=NEIGHBOUR_MAX_DELTA)
+    # First run: build from dataset.csv and keep it on disk for the other workers
+    matrix, crop_labels = load_training_rows('dataset.csv')
+    index = NeighbourIndex.build(matrix, crop_labels, path=path)
+    index.persist = False
+    index.max_delta = NEIGHBOUR_MAX_DELTA
+    return index
+
+# Historical samples most similar to the submitted one, shown next to the recommendation
+NEIGHBOUR_INDEX = LazyResource('neighbour_index', _load_neighbour_index)
+SIMILAR_K = int(os.environ.get('SOIL_SIMILAR_K', 5))
+
+# Memoized crop predictions keyed on quantized inputs; cleared whenever the crop model changes
+RECO_CACHE = RecommendationCache(
+    quantization=parse_quantization(os.environ.get('SOIL_RECO_QUANTIZATION')),
+    maxsize=int(os.environ.get('SOIL_RECO_CACHE_SIZE', 10000)),
+)
+
+# Form fields -> feature row, and JSON records -> feature matrix (see features.py)
+FORM_ENCODER = FeatureEncoder(FORM_FIELDS)
+RECORD_ENCODER = FeatureEncoder()
+# Above this many JSON records the column-wise encode_record_frame is faster than row by row
+VECTORIZED_ENCODING_MIN_ROWS = 1000
+
+# Number of ranked crops returned by /predict and /predict/batch unless top_k is given
+TOP_K = int(os.environ.get('SOIL_TOP_K', 3))
 
 # Crop dictionary
 crop_dict = {
@@ -28,26 +180,52 @@ crop_dict = {
     "pigeonpeas": 19, "kidneybeans": 20, "chickpea": 21, "coffee": 22
 }
 
-def read_file_as_image(data) -> tf.Tensor:
-    image = Image.open(BytesIO(data))
-    
-    # Resize the image to match the expected input shape (224, 224)
-    image = np.array(image)
-    image = tf.image.resize(image, (224, 224))
-    # Normalize the pixel values to be in the range [0, 1]
-    image = tf.cast(image, tf.float32) / 255.0
-    return image
-
-# Oracle Database connection
-dsn_tns = cx_Oracle.makedsn('DESKTOP-JRAAC71', 1521, service_name='XE')
-db_connection = cx_Oracle.connect(user='system', password='saicharan', dsn=dsn_tns)
-cursor = db_connection.cursor()
+# Oracle session pool (or SQLite stand-in, see db.py); routes acquire a connection per request
+DB_POOL = LazyResource('db_pool', create_pool)
+
+# Prediction rows are inserted in batches by a background thread, off the request path
+AUDIT_QUEUE = PredictionAuditQueue(
+    DB_POOL,
+    max_size=int(os.environ.get('SOIL_AUDIT_QUEUE_SIZE', 10000)),
+    batch_size=int(os.environ.get('SOIL_AUDIT_BATCH_SIZE', 100)),
+    flush_interval=float(os.environ.get('SOIL_AUDIT_FLUSH_SECONDS', 1.0)),
+    spill_path=os.environ.get('SOIL_AUDIT_SPILL_PATH', 'prediction_spill.jsonl'),
+)
+atexit.register(AUDIT_QUEUE.close)
+
+# Rows per /history page unless limit is given, and rows per fetch for /history/export
+HISTORY_PAGE_SIZE = int(os.environ.get('SOIL_HISTORY_PAGE_SIZE', 50))
+HISTORY_ARRAYSIZE = int(os.environ.get('SOIL_HISTORY_ARRAYSIZE', 500))
+
+# Dashboard JSON built from the rollup tables (see rollups.py) and served pre-serialized
+DASHBOARD_CACHE = LRUCache(maxsize=1, ttl=float(os.environ.get('SOIL_DASHBOARD_CACHE_SECONDS', 60)))
 
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-class User(UserMixin):
+# Anyone can register, so the /admin routes are limited to these user names (comma separated);
+# with none configured they are closed to everyone
+ADMIN_USERS = frozenset(name.strip() for name in os.environ.get('SOIL_ADMIN_USERS', '').split(',') if name.strip())
+
+def admin_required(view):
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if current_user.name not in ADMIN_USERS:
+            log.warning("Admin route refused", extra={'fields': {'user': current_user.name, 'path': request.path}})
+            return jsonify({'error': 'Admin access required.'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+class User:
+    # Slotted instead of UserMixin (which has a __dict__) so cached sessions stay small
+    __slots__ = ('name', 'mobile_number')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
     def __init__(self, name, mobile_number):
         self.name = name
         self.mobile_number = mobile_number
@@ -55,13 +233,39 @@ class User(UserMixin):
     def get_id(self):
         return str(self.name)
 
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+# Flask-Login calls load_user on every request with a session
+USER_CACHE = LRUCache(
+    maxsize=int(os.environ.get('SOIL_USER_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('SOIL_USER_CACHE_TTL', 300)),
+)
+
 @login_manager.user_loader
 def load_user(user_name):
+    user = USER_CACHE.get(user_name)
+    if user is not None:
+        return user
     query = "SELECT name, mobile_number FROM users WHERE name = :1"
-    cursor.execute(query, (user_name,))
-    result = cursor.fetchone()
+    with DB_POOL.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, (user_name,))
+        result = cursor.fetchone()
     if result:
-        return User(result[0], result[1])
+        user = User(result[0], result[1])
+        USER_CACHE.set(user_name, user)
+        return user
     return None
 
 class LoginForm(FlaskForm):
@@ -83,27 +287,29 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         query = "SELECT name, mobile_number FROM users WHERE name = :1"
-        cursor.execute(query, (form.name.data,))
-        result = cursor.fetchone()
+        with DB_POOL.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, (form.name.data,))
+            result = cursor.fetchone()
         if result and result[1] == form.mobile_number.data:
             user = User(result[0], result[1])
+            USER_CACHE.set(user.get_id(), user)
             login_user(user)
-            print("Login successful!")
+            log.info("Login successful", extra={'fields': {'user': user.name}})
             return redirect(url_for('predict_soil'))
         else:
-            print("Incorrect credentials!")
+            log.warning("Incorrect credentials", extra={'fields': {'user': form.name.data}})
     return render_template('login.html', form=form)
 
 @app.route('/predict_soil', methods=['GET', 'POST'])
 @login_required
 def predict_soil():
     if request.method == 'POST':
-        file = request.files['file']
-        image = read_file_as_image(file.read())
-        img_batch = tf.expand_dims(image, 0)
-        prediction = MODEL.predict(img_batch)
-        predicted_class = labels[np.argmax(prediction[0])]
-        acc = np.max(prediction[0])
+        with STAGE_SECONDS.time(route='predict_soil', stage='read'):
+            data = request.files['file'].read()
+        prediction = classify_soil(data, 'predict_soil')
+        predicted_class = labels[np.argmax(prediction)]
+        acc = np.max(prediction)
         return jsonify({
             'class': predicted_class,
             'probability': float(acc)
@@ -112,18 +318,55 @@ def predict_soil():
         # Handle GET request, e.g., render a form or redirect
         return render_template('predict_form.html')  # Update with the appropriate template
 
+@app.route('/predict_soil/batch', methods=['POST'])
+@login_required
+def predict_soil_batch():
+    # A zip of images in, one JSON line per image out as soon as its batch is classified
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'No zip archive uploaded.'}), 400
+    # Werkzeug closes request.files when the view returns, before the response has streamed
+    spool = tempfile.TemporaryFile()
+    upload.save(spool)
+    try:
+        archive = zipfile.ZipFile(spool)
+    except zipfile.BadZipFile:
+        spool.close()
+        return jsonify({'error': 'The upload is not a zip archive.'}), 400
+
+    def predict(images):
+        # Whole batches go straight to the model, past the micro-batcher and the inference pool
+        with STAGE_SECONDS.time(route='predict_soil_batch', stage='model'):
+            return SOIL_CLASSIFIER.get().predict(images)
+
+    def generate():
+        started = time.perf_counter()
+        count = errors = 0
+        with spool, archive:
+            for result in classify_images(iter_zip(archive), predict, BULK_DECODE_EXECUTOR, BULK_BATCH_SIZE, labels):
+                count += 1
+                errors += 'error' in result
+                yield json.dumps(result) + '\n'
+        seconds = time.perf_counter() - started
+        log.info("Bulk soil classification", extra={'sample': False, 'fields': {'images': count, 'errors': errors,
+                                                                                'seconds': round(seconds, 3)}})
+        yield json.dumps({'summary': {'count': count, 'errors': errors, 'seconds': seconds,
+                                      'images_per_s': count / seconds if seconds else None}}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     predicted_class = None
     probability = None
     if request.method == "POST":
-        file = request.files.get('file')
-        if file:
-            image = read_file_as_image(file.read())
-            img_batch = tf.expand_dims(image, 0)
-            prediction = MODEL.predict(img_batch)
-            predicted_class = labels[np.argmax(prediction[0])]
-            probability = np.max(prediction[0])
+        with STAGE_SECONDS.time(route='index', stage='read'):
+            file = request.files.get('file')
+            data = file.read() if file else None
+        if data:
+            prediction = classify_soil(data, 'index')
+            predicted_class = labels[np.argmax(prediction)]
+            probability = np.max(prediction)
     
     return render_template("predict_form.html", predicted_class=predicted_class, probability=probability)   
 
@@ -132,12 +375,87 @@ def index():
 def dashboard():
     return render_template('index.html', name=current_user.name)
 
+def dashboard_views():
+    # Rebuilt from a few hundred rollup rows at most once per SOIL_DASHBOARD_CACHE_SECONDS
+    views = DASHBOARD_CACHE.get('views')
+    if views is None:
+        views = {name: json.dumps(view).encode() for name, view in load_views(DB_POOL).items()}
+        DASHBOARD_CACHE.set('views', views)
+    return views
+
+@app.route('/dashboard/<any(crops_by_soil, monthly, feature_means):view>', methods=['GET'])
+@login_required
+def dashboard_data(view):
+    response = Response(dashboard_views()[view], content_type='application/json')
+    response.cache_control.private = True
+    response.cache_control.max_age = max(0, int(DASHBOARD_CACHE.ttl))
+    return response
+
 # Add this route for the soil dashboard
 @app.route('/soil_dashboard', methods=['GET', 'POST'])
 @login_required
 def soil_dashboard():
     return redirect(url_for('dashboard'))
 
+@app.route('/admin/stats', methods=['GET'])
+@admin_required
+def admin_stats():
+    return jsonify({
+        'soil_batcher': SOIL_BATCHER.stats(),
+        'inference_pool': INFERENCE_POOL.stats() if INFERENCE_POOL is not None else None,
+        'db': DB_POOL.stats(),
+        'audit': AUDIT_QUEUE.stats(),
+        'user_cache': USER_CACHE.stats(),
+        'recommendation_cache': RECO_CACHE.stats(),
+        'dashboard_cache': DASHBOARD_CACHE.stats(),
+        'neighbour_index': NEIGHBOUR_INDEX.stats() if NEIGHBOUR_INDEX.loaded else None,
+        'startup': startup_report()
+    })
+
+@app.route('/admin/models', methods=['GET'])
+@admin_required
+def admin_models():
+    return jsonify({
+        'soil_model': SOIL_CLASSIFIER.stats(),
+        'crop_model': CROP_MODEL.stats()
+    })
+
+@app.route('/admin/models/reload', methods=['POST'])
+@admin_required
+def admin_models_reload():
+    # Check for new versions now instead of waiting for the next poll
+    swapped = {}
+    for registry in (SOIL_CLASSIFIER, CROP_MODEL):
+        try:
+            swapped[registry.name] = registry.check()
+        except Exception as exc:
+            swapped[registry.name] = repr(exc)
+    log.info("Model reload requested", extra={'sample': False, 'fields': {'user': current_user.name, **swapped}})
+    return jsonify(swapped)
+
+@app.errorhandler(InferenceTimeout)
+def inference_timeout(exc):
+    return jsonify({'error': 'Prediction timed out, please try again.'}), 504
+
+# Gauges read from the components' own stats at scrape time
+METRICS.gauge('soil_batcher_queue_depth', "Images waiting for the next soil model batch",
+              lambda: SOIL_BATCHER.stats()['queue_depth'])
+METRICS.gauge('audit_queue_depth', "Prediction rows waiting to be written", lambda: AUDIT_QUEUE.stats()['queue_depth'])
+METRICS.gauge('audit_spilled_rows', "Prediction rows spilled to disk", lambda: AUDIT_QUEUE.stats()['spilled'])
+METRICS.gauge('recommendation_cache_hit_ratio', "Hit ratio of the crop recommendation cache",
+              lambda: RECO_CACHE.stats()['hit_ratio'])
+METRICS.gauge('inference_pool_pending', "Jobs submitted to the inference pool and not yet answered",
+              lambda: INFERENCE_POOL.stats()['pending'] if INFERENCE_POOL is not None else None)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
+@app.route('/health', methods=['GET'])
+def health():
+    db_ok = DB_POOL.ping()
+    return jsonify({'db': db_ok}), 200 if db_ok else 503
+
 @app.route('/logout', methods=['GET', 'POST'])
 @login_required
 def logout():
@@ -149,77 +467,229 @@ def register():
     form = RegisterForm()
     if form.validate_on_submit():
         insert_query = "INSERT INTO users(name, mobile_number) VALUES (:1, :2)"
-        cursor.execute(insert_query, (form.name.data, form.mobile_number.data))
-        db_connection.commit()
+        with DB_POOL.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(insert_query, (form.name.data, form.mobile_number.data))
+            conn.commit()
+        USER_CACHE.invalidate(form.name.data)
         return redirect(url_for('login'))
     
     return render_template('register.html', form=form)
 
+def wants_json():
+    # ?format=json or an Accept header that prefers JSON over HTML
+    if request.args.get('format') == 'json':
+        return True
+    best = request.accept_mimetypes.best_match(['text/html', 'application/json'])
+    return best == 'application/json' and request.accept_mimetypes[best] > request.accept_mimetypes['text/html']
+
+def form_values(form, row, soil=None):
+    """The /predict inputs as entered, for the prediction log; ``soil`` overrides the form's Soil."""
+    N, P, K = (int(v) for v in row[:3])
+    temp, humidity, ph, rainfall = (float(form[f]) for f in FORM_FIELDS[3:7])
+    return (N, P, K, temp, humidity, ph, rainfall, soil or form['Soil'])
+
+def recommend(form, use_cache=True, k=TOP_K):
+    """Validate and rank one /predict form; shared with the async route in asgi_app.py.
+
+    Returns ``(row, values, ranking)`` where ``values`` are the inputs as
+    entered, for the prediction log. Raises ``InvalidFeatures``.
+    """
+    # Validate the form fields straight into a float32 feature row (one pass, see FeatureEncoder)
+    with STAGE_SECONDS.time(route='predict', stage='validate_encode'):
+        row = FORM_ENCODER.encode(form)
+    values = form_values(form, row)
+
+    # Rank crops using the loaded model, unless the client asked to skip the cache
+    with STAGE_SECONDS.time(route='predict', stage='model'):
+        ranking = RECO_CACHE.rank(CROP_MODEL.get(), row, k=k, use_cache=use_cache, ranker=rank_crops)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Prediction", extra={'fields': {'inputs': list(values), 'ranking': ranking}})
+    return row, values, ranking
+
+def record_recommendation(user, row, values, crop, route='predict'):
+    """Look up similar past samples and queue the prediction row; returns the similar samples."""
+    with STAGE_SECONDS.time(route=route, stage='similar'):
+        similar = NEIGHBOUR_INDEX.query(row, SIMILAR_K, exclude_exact=True)[0]
+        NEIGHBOUR_INDEX.add(row, str(crop))
+    # Queue runtime values for the Oracle Database (written behind by AUDIT_QUEUE), stamped now
+    # rather than whenever the row is flushed or replayed from the spill file
+    with STAGE_SECONDS.time(route=route, stage='db_insert'):
+        AUDIT_QUEUE.put((user.name, user.mobile_number) + values + (str(crop), predicted_at()))
+    return similar
+
 # This is the existing /predict route, keep it as it is
 @app.route("/predict", methods=['POST'])
 def predict():
-    # Extracting features from the form
-    N = int(request.form['Nitrogen'])
-    P = int(request.form['Phosphorus'])
-    K = int(request.form['Potassium'])
-    temp = float(request.form['Temperature'])
-    humidity = float(request.form['Humidity'])
-    ph = float(request.form['pH'])
-    rainfall = float(request.form['Rainfall'])
-    soil = request.form['Soil']
-
-    # Creating a DataFrame with the input features
-    input_df = pd.DataFrame({'N': [N], 'P': [P], 'K': [K], 'temperature': [temp],
-                             'humidity': [humidity], 'ph': [ph], 'rainfall': [rainfall], 'soil': [soil]})
-
-    # Validation for pH, temperature, humidity, and soil
-    ph_value = float(input_df['ph'].values[0])
-    temp_value = float(input_df['temperature'].values[0])
-    humidity_value = float(input_df['humidity'].values[0])
-    soil_value = input_df['soil'].values[0]
-
-    print("Input values:", N, P, K, temp, humidity, ph, rainfall, soil)
-    print("pH:", ph_value, "Temperature:", temp_value, "Humidity:", humidity_value, "Soil:", soil_value)
-
-    if 0 < ph_value <= 14 and 0 < temp_value < 60 and humidity_value > 0 and soil_value in ["Alluvial", "Black", "Clay", "Red"]:
-        # One-hot encoding for the "soil" attribute
-        input_df['soil'] = input_df['soil'].map({'Alluvial': 0, 'Black': 1, 'Clay': 2, 'Red': 3})
-
-        # Ensure that the input data columns match the expected columns used during training
-        expected_columns = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall', 'soil']
-        input_df = input_df.reindex(columns=expected_columns, fill_value=0)
-
-        # Make predictions using the loaded model
-        result = loaded_model.predict(input_df)
-
-        print("Prediction result:", result)
-
-        # Handling prediction result
-        predicted_crop_id = result[0]
-        if predicted_crop_id in crop_dict:
-            print("Crop is present in dictionary.")
-            crop = predicted_crop_id
-            result_str = "{} is the suitable crop ".format(crop)
-
-            # Insert runtime values into Oracle Database
-            insert_query = "INSERT INTO prediction (name, mobile_number, N, P, K, temperature, humidity, ph, rainfall, soil, predicted_crop) VALUES (:1, :2, :3, :4, :5, :6, :7, :8, :9, :10, :11)"
-            cursor.execute(insert_query, (current_user.name, current_user.mobile_number, N, P, K, temp, humidity, ph, rainfall, soil, crop))
-          #  cursor.execute(insert_query, (current_user.name, current_user.mobile_number, N, P, K, temp, humidity, ph, rainfall, soil, crop))
-
-            db_connection.commit()
-
-            return render_template('index.html', result=str(result_str))
+    with STAGE_SECONDS.time(route='predict', stage='parse'):
+        form = request.form
+
+    use_cache = not (form.get('nocache') or 'no-cache' in request.headers.get('Cache-Control', ''))
+    try:
+        row, values, ranking = recommend(form, use_cache, request.values.get('top_k', TOP_K, type=int))
+    except InvalidFeatures as exc:
+        log.info("Invalid input values", extra={'fields': {'error': str(exc)}})
+        if wants_json():
+            return jsonify({'error': str(exc)}), 400
+        return "Sorry... Error in entered values in the form. Please check the values and fill it again."
+
+    # Handling prediction result
+    predicted_crop_id = ranking[0][0]
+    if predicted_crop_id in crop_dict:
+        crop = predicted_crop_id
+        result_str = "{} is the suitable crop ".format(crop)
+        top_crops = [{'crop': c, 'score': score} for c, score in ranking if c in crop_dict]
+        similar = record_recommendation(current_user, row, values, crop)
+
+        with STAGE_SECONDS.time(route='predict', stage='render'):
+            if wants_json():
+                return jsonify({'crop': crop, 'top_crops': top_crops, 'similar': similar})
+            return render_template('index.html', result=str(result_str), top_crops=top_crops, similar=similar)
+    else:
+        log.warning("Crop not found in dictionary", extra={'fields': {'crop': repr(predicted_crop_id)}})
+        if wants_json():
+            return jsonify({'error': 'Could not determine the best crop.'}), 422
+        return "Sorry, we could not determine the best crop to be cultivated with the provided data."
+
+@app.route("/predict/combined", methods=['POST'])
+@login_required
+def predict_combined():
+    # A soil photo plus the /predict fields except Soil, which comes from the image model
+    with STAGE_SECONDS.time(route='predict_combined', stage='parse'):
+        upload = request.files.get('file')
+        data = upload.read() if upload else b''
+        form = request.form
+    if not data:
+        return jsonify({'error': 'No image uploaded.'}), 400
+    try:
+        with STAGE_SECONDS.time(route='predict_combined', stage='validate_encode'):
+            row = FORM_ENCODER.encode(dict(form.items(), Soil=next(iter(SOIL_CODES))))
+    except InvalidFeatures as exc:
+        log.info("Invalid input values", extra={'fields': {'error': str(exc)}})
+        return jsonify({'error': str(exc)}), 400
+
+    # The image is classified on another thread while the crop model ranks the sample once
+    # for every soil type, so neither model waits for the other
+    soil_future = COMBINED_EXECUTOR.submit(classify_soil, data, 'predict_combined')
+    candidates = np.repeat(row[np.newaxis], len(SOIL_CODES), axis=0)
+    candidates[:, -1] = list(SOIL_CODES.values())
+    with STAGE_SECONDS.time(route='predict_combined', stage='crop_model'):
+        rankings = rank_crops(CROP_MODEL.get(), candidates, request.values.get('top_k', TOP_K, type=int))
+    with STAGE_SECONDS.time(route='predict_combined', stage='soil_wait'):
+        try:
+            prediction = soil_future.result()
+        except InferenceTimeout:
+            raise  # an OSError subclass too, but it belongs to the 504 handler, not "bad image"
+        except DECODE_ERRORS:
+            return jsonify({'error': 'Could not read the uploaded image.'}), 400
+
+    soil_class = labels[int(np.argmax(prediction))]
+    soil = SOIL_FORM_VALUES[soil_class]
+    row = candidates[list(SOIL_CODES).index(soil)]
+    ranking = rankings[list(SOIL_CODES).index(soil)]
+    crop = ranking[0][0]
+    if crop not in crop_dict:
+        log.warning("Crop not found in dictionary", extra={'fields': {'crop': repr(crop)}})
+        return jsonify({'error': 'Could not determine the best crop.'}), 422
+
+    top_crops = [{'crop': c, 'score': score} for c, score in ranking if c in crop_dict]
+    similar = record_recommendation(current_user, row, form_values(form, row, soil), crop, route='predict_combined')
+    return jsonify({
+        'soil': {'class': soil_class, 'probability': float(np.max(prediction)), 'value': soil},
+        'crop': crop,
+        'top_crops': top_crops,
+        'similar': similar,
+    })
+
+@app.route("/predict/batch", methods=['POST'])
+def predict_batch():
+    # Accepts a JSON array of records or a CSV body laid out like dataset.csv
+    if request.is_json:
+        records = request.get_json(silent=True)
+        if not isinstance(records, list):
+            return jsonify({'error': 'Expected a JSON array of soil samples.'}), 400
+        count = len(records)
+        if count <= VECTORIZED_ENCODING_MIN_ROWS:
+            matrix, row_ids, errors = RECORD_ENCODER.encode_records(records)
         else:
-            print("Crop not found in dictionary.")
-            print("Crop from result:", repr(predicted_crop_id))
-            print("Crop dictionary keys:", crop_dict.keys())
-            return "Sorry, we could not determine the best crop to be cultivated with the provided data."
+            matrix, row_ids, errors = encode_record_frame(records)
     else:
-        return "Sorry... Error in entered values in the form. Please check the values and fill it again."
+        upload = request.files.get('file')
+        data = upload.read() if upload else request.get_data()
+        try:
+            input_df = pd.read_csv(BytesIO(data))
+        except (ValueError, pd.errors.ParserError):
+            return jsonify({'error': 'Could not parse the CSV body.'}), 400
+        count = len(input_df)
+        matrix, row_ids, errors = encode_frame(input_df)
+
+    # One model call ranks every valid row in the batch
+    predictions = []
+    if len(row_ids):
+        k = request.args.get('top_k', TOP_K, type=int)
+        rankings = rank_rows(CROP_MODEL.get(), matrix, k)
+        for row, ranking in zip(row_ids.tolist(), rankings):
+            crop = ranking[0][0]
+            if crop in crop_dict:
+                top_crops = [{'crop': c, 'score': score} for c, score in ranking if c in crop_dict]
+                predictions.append({'row': row, 'crop': crop, 'top_crops': top_crops})
+            else:
+                errors.append({'row': row, 'error': 'Could not determine the best crop.'})
+
+    return jsonify({
+        'count': count,
+        'predictions': predictions,
+        'errors': sorted(errors, key=lambda e: e['row'])
+    })
+
+@app.route("/history", methods=['GET'])
+@login_required
+def history():
+    # The user's predictions newest first; follow next_cursor for older pages
+    try:
+        filters = parse_filters(request.args)
+        limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+        page = fetch_page(DB_POOL, current_user.name, filters, request.args.get('cursor'), limit)
+    except InvalidHistoryQuery as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify(page)
+
+@app.route("/history/export", methods=['GET'])
+@login_required
+def history_export():
+    # Every matching prediction as JSON lines, streamed straight from the cursor
+    try:
+        filters = parse_filters(request.args)
+    except InvalidHistoryQuery as exc:
+        return jsonify({'error': str(exc)}), 400
+    name = current_user.name
+
+    def generate():
+        for item in iter_history(DB_POOL, name, filters, HISTORY_ARRAYSIZE):
+            yield json.dumps(item) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 # ... (rest of the code)
 
+def warm_up(soil_model=True):
+    """Load resources ahead of the first request instead of lazily."""
+    # preload() does not start the version watchers, which only run in workers
+    CROP_MODEL.preload()
+    if soil_model:
+        SOIL_CLASSIFIER.preload()
+    log.info("Startup report", extra={'sample': False, 'fields': startup_report()})
+
+def after_fork():
+    # Pooled connections opened in the gunicorn master must not be shared with workers
+    DB_POOL.reset()
+    if EAGER_LOAD:
+        warm_up()
+        DB_POOL.get()
+
 if __name__ == "__main__":
+    if EAGER_LOAD:
+        warm_up()
     app.run(host='localhost', port=8000, debug=True)
 
 
@@ -0,0 +1,19 @@
+# Picked up automatically by `gunicorn final_product:app` (see Procfile).
+import os
+
+# SOIL_PRELOAD_APP=1 imports the app once in the master and forks workers from it,
+# so the Python imports and the crop model are shared copy-on-write.
+preload_app = os.environ.get('SOIL_PRELOAD_APP', '0') == '1'
+
+
+def when_ready(server):
+    if preload_app:
+        import final_product
+        # TensorFlow's runtime threads do not survive fork, so the Keras model
+        # is left to each worker (loaded in post_fork with SOIL_EAGER_LOAD=1).
+        final_product.warm_up(soil_model=False)
+
+
+def post_fork(server, worker):
+    import final_product
+    final_product.after_fork()
@@ -0,0 +1,154 @@
+"""Reading a user's past predictions back out of the ``prediction`` table.
+
+Rows come newest first, ordered by ``(created_at, id)``. Pages use a keyset,
+not an OFFSET. Each page ends with an opaque cursor holding its last row's
+key, and the next page asks for rows strictly older than that key. Every page
+is then a single range scan of one of the (name, [crop | soil,] created_at,
+id) indexes from prediction_history.sql, however deep it is. Exports stream
+the same query with ``fetchmany`` instead of paging.
+
+Rows reach the table through the audit queue, so a prediction shows up here
+once its batch has been flushed (SOIL_AUDIT_FLUSH_SECONDS). ``created_at`` is
+the UTC time the prediction was made, and the ``from``/``to`` filters are
+compared with it.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+
+from features import SOIL_CODES
+
+HISTORY_COLUMNS = ['id', 'created_at', 'N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall', 'soil',
+                   'predicted_crop']
+MAX_PAGE_SIZE = 500
+
+
+class InvalidHistoryQuery(ValueError):
+    """Raised for filters or cursors that cannot be turned into a history query."""
+
+
+def _parse_time(name, value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidHistoryQuery("{} must be an ISO date or date and time".format(name))
+
+
+def parse_filters(args):
+    """Filters from request arguments: ``crop``, ``soil``, ``from`` (inclusive) and ``to`` (exclusive)."""
+    filters = {}
+    if args.get('crop'):
+        filters['crop'] = args['crop']
+    if args.get('soil'):
+        if args['soil'] not in SOIL_CODES:
+            raise InvalidHistoryQuery("soil must be one of {}".format(", ".join(SOIL_CODES)))
+        filters['soil'] = args['soil']
+    for name in ('from', 'to'):
+        if args.get(name):
+            filters[name] = _parse_time(name, args[name])
+    return filters
+
+
+def encode_cursor(created_at, row_id):
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidHistoryQuery("invalid cursor")
+
+
+def _bind_time(value, dialect):
+    # created_at is UTC without a zone; times given with an offset are converted to match
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    # The SQLite stand-in stores created_at as text with millisecond precision
+    if dialect == 'sqlite':
+        return value.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    return value
+
+
+def _as_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def build_query(name, filters, after=None, limit=None, dialect='oracle'):
+    """``(sql, params)`` for the user's rows matching ``filters``, newest first.
+
+    ``after`` is a decoded cursor ``(created_at, id)``; only rows older than it
+    are returned. ``limit`` caps the rows the database produces.
+    """
+    params = []
+
+    def bind(value):
+        params.append(value)
+        return ':{}'.format(len(params))
+
+    clauses = ['name = ' + bind(name)]
+    if 'crop' in filters:
+        clauses.append('predicted_crop = ' + bind(filters['crop']))
+    if 'soil' in filters:
+        clauses.append('soil = ' + bind(filters['soil']))
+    if 'from' in filters:
+        clauses.append('created_at >= ' + bind(_bind_time(filters['from'], dialect)))
+    if 'to' in filters:
+        clauses.append('created_at < ' + bind(_bind_time(filters['to'], dialect)))
+    if after is not None:
+        # (created_at, id) < (:t, :id). Oracle has no row-value comparison, and the leading
+        # created_at <= :t is what lets both databases seek the index instead of filtering
+        created_at = _bind_time(after[0], dialect)
+        clauses.append('created_at <= {} AND (created_at < {} OR id < {})'.format(
+            bind(created_at), bind(created_at), bind(after[1])))
+
+    sql = 'SELECT {} FROM prediction WHERE {} ORDER BY created_at DESC, id DESC'.format(
+        ', '.join(HISTORY_COLUMNS), ' AND '.join(clauses))
+    if limit is not None:
+        sql += (' LIMIT {:d}' if dialect == 'sqlite' else ' FETCH FIRST {:d} ROWS ONLY').format(limit)
+    return sql, params
+
+
+def _item(row):
+    item = dict(zip(HISTORY_COLUMNS, row))
+    item['created_at'] = _as_datetime(item['created_at']).isoformat()
+    return item
+
+
+def fetch_page(pool, name, filters, cursor=None, limit=50):
+    """One page of history: ``{'items': [...], 'next_cursor': token or None}``."""
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise InvalidHistoryQuery("limit must be between 1 and {}".format(MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+    # One extra row tells whether there is a next page without a COUNT
+    sql, params = build_query(name, filters, after, limit + 1, pool.dialect)
+    with pool.connection() as conn:
+        db_cursor = conn.cursor()
+        # The whole page in one round trip
+        db_cursor.arraysize = db_cursor.prefetchrows = limit + 1
+        db_cursor.execute(sql, params)
+        rows = db_cursor.fetchmany(limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = dict(zip(HISTORY_COLUMNS, rows[-1]))
+        next_cursor = encode_cursor(_as_datetime(last['created_at']), last['id'])
+    return {'items': [_item(row) for row in rows], 'next_cursor': next_cursor}
+
+
+def iter_history(pool, name, filters, arraysize=500):
+    """Every matching row as a dict, fetched ``arraysize`` rows per round trip."""
+    sql, params = build_query(name, filters, dialect=pool.dialect)
+    with pool.connection() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.arraysize = db_cursor.prefetchrows = arraysize
+        db_cursor.execute(sql, params)
+        while True:
+            rows = db_cursor.fetchmany(arraysize)
+            if not rows:
+                break
+            for row in rows:
+                yield _item(row)
@@ -0,0 +1,52 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = (224, 224)
+# Classes of the soil image model, in the order of its outputs
+SOIL_LABELS = ["Alluvial_Soil", "Black_Soil", "Clay_Soil", "Red_Soil"]
+# The /predict form's Soil value (a key of features.SOIL_CODES) for each class
+SOIL_FORM_VALUES = {"Alluvial_Soil": "Alluvial", "Black_Soil": "Black", "Clay_Soil": "Clay", "Red_Soil": "Red"}
+# File extensions treated as images when scanning folders and archives
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+_SCALE = np.float32(1.0 / 255.0)
+
+
+def decode_image(data):
+    """Decode uploaded bytes into an RGB ``PIL.Image`` close to IMAGE_SIZE.
+
+    JPEGs are decoded at reduced size with ``Image.draft`` (libjpeg scales by
+    1/2, 1/4 or 1/8 while decoding), so a 12 MP phone photo never gets fully
+    materialized. Grayscale, palette and RGBA uploads are converted to RGB.
+    """
+    image = Image.open(BytesIO(data))
+    image.draft('RGB', IMAGE_SIZE)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.load()
+    return image
+
+
+def resize_image(image):
+    if image.size != IMAGE_SIZE:
+        image = image.resize(IMAGE_SIZE, Image.BILINEAR, reducing_gap=3.0)
+    return image
+
+
+def to_array(image, out=None):
+    """Normalized float32 224x224x3 pixels of a resized image.
+
+    The pixels are written straight into ``out`` when given (e.g. a row of a
+    preallocated batch), otherwise into a new float32 array.
+    """
+    if out is None:
+        out = np.empty((IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+    # Normalize the pixel values to be in the range [0, 1]
+    np.multiply(np.asarray(image), _SCALE, out=out)
+    return out
+
+
+def read_file_as_image(data, out=None):
+    """Decode, resize and normalize an uploaded image in one call."""
+    return to_array(resize_image(decode_image(data)), out)
@@ -0,0 +1,274 @@
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from imaging import IMAGE_SIZE, to_array
+
+SLOT_SHAPE = (IMAGE_SIZE[1], IMAGE_SIZE[0], 3)
+
+
+class PoolSaturated(RuntimeError):
+    """No image slot or queue capacity was free; the caller should degrade."""
+
+
+class InferenceTimeout(TimeoutError):
+    """A job did not finish within the per-job timeout."""
+
+
+class WorkerExited(RuntimeError):
+    """The worker process holding a job died before answering it."""
+
+
+def _discover(spec):
+    from registry import file_versions, numbered_versions
+    if spec[0] == 'numbered':
+        return numbered_versions(*spec[1:])
+    return file_versions(spec[1])
+
+
+def _load_soil_classifier(path):
+    from soil_model import load_soil_classifier
+    return load_soil_classifier(path)
+
+
+def _worker_main(tasks, results, shm_name, n_slots, soil_spec, crop_spec, poll_interval, max_batch_size):
+    """Body of one model-holding worker process.
+
+    Models are loaded on the first job that needs them and hot-reloaded
+    through the same registry as the web process. Up to ``max_batch_size``
+    queued jobs are drained at once so images share one forward pass.
+    """
+    from recommendation import top_k
+    from registry import ModelRegistry, load_crop_model
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray((n_slots,) + SLOT_SHAPE, dtype=np.float32, buffer=shm.buf)
+    soil = ModelRegistry('soil_model', _discover(soil_spec), _load_soil_classifier, poll_interval=poll_interval)
+    crop = ModelRegistry('crop_model', _discover(crop_spec), load_crop_model, poll_interval=poll_interval)
+
+    running = True
+    while running:
+        batch = [tasks.get()]
+        while len(batch) < max_batch_size:
+            try:
+                batch.append(tasks.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:
+            running = False
+            batch = [task for task in batch if task is not None]
+
+        images = [task for task in batch if task[0] == 'image']
+        if images:
+            try:
+                # Copy out of the shared slots so the parent can reuse them as soon as we answer
+                probabilities = soil.get().predict(slots[[slot for _, _, slot in images]])
+                for (_, job_id, _), row in zip(images, probabilities):
+                    results.put((job_id, True, row))
+            except Exception as exc:
+                for _, job_id, _ in images:
+                    results.put((job_id, False, repr(exc)))
+
+        for _, job_id, matrix, k in (task for task in batch if task[0] == 'crop'):
+            try:
+                labels, scores = top_k(crop.get(), matrix, k)
+                results.put((job_id, True, (labels, scores)))
+            except Exception as exc:
+                results.put((job_id, False, repr(exc)))
+    shm.close()
+
+
+class InferencePool:
+    """Dedicated model-holding worker processes for soil and crop inference.
+
+    Images are decoded in the web process and normalized straight into a
+    slot of a shared memory block; only the slot index crosses the process
+    boundary, so no pixel data is pickled. Each of ``size`` spawned workers
+    holds its own copy of the models and has its own task queue; jobs go to
+    the worker with the fewest outstanding, so a worker that dies is known to
+    have held exactly those jobs, which fail with ``WorkerExited`` and give
+    their slots back when it is replaced. When no image slot frees up within
+    ``acquire_timeout`` or ``max_pending`` jobs are already queued,
+    ``PoolSaturated`` is raised so the caller can fall back to in-process
+    inference; a job that takes longer than ``timeout`` raises
+    ``InferenceTimeout``.
+    """
+
+    def __init__(self, size=2, soil_spec=('numbered', './models'), crop_spec=('file', 'crop.pkl'),
+                 slots=None, max_pending=256, timeout=5.0, acquire_timeout=0.05, max_batch_size=16,
+                 poll_interval=30):
+        self.size = size
+        self.n_slots = slots or size * max_batch_size
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.max_batch_size = max_batch_size
+        self._worker_args = (soil_spec, crop_spec, poll_interval, max_batch_size)
+        self._ctx = mp.get_context('spawn')
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._futures = {}
+        self._procs = []
+        self._queues = []
+        self._held = []
+        self._shm = None
+        self._dispatcher = None
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.saturated = 0
+        self.restarts = 0
+
+    def _spawn(self, i):
+        # A fresh queue each time: whatever the dead worker left in its old one is failed, not rerun
+        if self._queues[i] is not None:
+            # Nobody reads the old pipe any more, so don't let exit wait on flushing it
+            self._queues[i].cancel_join_thread()
+            self._queues[i].close()
+        self._queues[i] = self._ctx.Queue()
+        self._held[i] = set()
+        proc = self._ctx.Process(target=_worker_main, name="inference-worker", daemon=True,
+                                 args=(self._queues[i], self._results, self._shm.name, self.n_slots)
+                                 + self._worker_args)
+        proc.start()
+        self._procs[i] = proc
+
+    def _release(self, job_id):
+        """Forget a job; returns its future (None if already released). Call with the lock held."""
+        future, slot, worker = self._futures.pop(job_id, (None, None, None))
+        if worker is not None:
+            self._held[worker].discard(job_id)
+        # The slot is only reused once the worker is done with it, even if the caller timed out
+        if slot is not None:
+            self._free.put(slot)
+        return future
+
+    def _ensure_started(self):
+        if self._shm is not None and all(p.is_alive() for p in self._procs):
+            return
+        lost = []
+        with self._lock:
+            if self._shm is None:
+                self._shm = shared_memory.SharedMemory(create=True, size=self.n_slots * int(np.prod(SLOT_SHAPE)) * 4)
+                self._slots = np.ndarray((self.n_slots,) + SLOT_SHAPE, dtype=np.float32, buffer=self._shm.buf)
+                self._free = queue.Queue()
+                for i in range(self.n_slots):
+                    self._free.put(i)
+                self._results = self._ctx.Queue()
+                self._procs = [None] * self.size
+                self._queues = [None] * self.size
+                self._held = [set() for _ in range(self.size)]
+                for i in range(self.size):
+                    self._spawn(i)
+                self._dispatcher = threading.Thread(target=self._dispatch, name="inference-results", daemon=True)
+                self._dispatcher.start()
+            for i, proc in enumerate(self._procs):
+                if not proc.is_alive():
+                    # Fail what the dead worker held and free its slots before its replacement starts
+                    held = list(self._held[i])
+                    lost.extend(self._release(job_id) for job_id in held)
+                    self.failed += len(held)
+                    self._spawn(i)
+                    self.restarts += 1
+        for future in lost:
+            if future is not None:
+                future.set_exception(WorkerExited("inference worker exited"))
+
+    def _submit(self, task_factory, slot=None):
+        future = Future()
+        with self._lock:
+            job_id = next(self._ids)
+            worker = min(range(self.size), key=lambda i: len(self._held[i]))
+            self._futures[job_id] = (future, slot, worker)
+            self._held[worker].add(job_id)
+            self.submitted += 1
+            self._queues[worker].put(task_factory(job_id))
+        return future
+
+    def _dispatch(self):
+        while True:
+            job_id, ok, payload = self._results.get()
+            with self._lock:
+                future = self._release(job_id)
+                if future is None:
+                    # Already failed because its worker was replaced
+                    continue
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def _wait(self, future, timeout):
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            raise InferenceTimeout("inference job did not finish in time")
+
+    def classify_image(self, image, timeout=None):
+        """Soil class probabilities for a decoded image already at IMAGE_SIZE.
+
+        The normalized pixels are written into a shared memory slot; see
+        ``imaging.decode_image`` and ``imaging.resize_image``.
+        """
+        self._ensure_started()
+        try:
+            slot = self._free.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            self.saturated += 1
+            raise PoolSaturated("no free image slot")
+        try:
+            to_array(image, out=self._slots[slot])
+        except Exception:
+            self._free.put(slot)
+            raise
+        future = self._submit(lambda job_id: ('image', job_id, slot), slot)
+        return self._wait(future, timeout)
+
+    def rank_crops(self, matrix, k=3, timeout=None):
+        """``recommendation.top_k`` computed in a worker process."""
+        self._ensure_started()
+        if len(self._futures) >= self.max_pending:
+            self.saturated += 1
+            raise PoolSaturated("too many pending jobs")
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        future = self._submit(lambda job_id: ('crop', job_id, matrix, k))
+        return self._wait(future, timeout)
+
+    def close(self):
+        if self._shm is None:
+            return
+        for tasks in self._queues:
+            tasks.put(None)
+        for proc in self._procs:
+            proc.join(5)
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'alive': sum(p.is_alive() for p in self._procs),
+                'slots': self.n_slots,
+                'free_slots': self._free.qsize() if self._shm is not None else self.n_slots,
+                'pending': len(self._futures),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'timeouts': self.timeouts,
+                'saturated': self.saturated,
+                'restarts': self.restarts,
+            }
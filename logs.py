@@ -0,0 +1,69 @@
+"""Leveled, sampled, structured logging for the web app.
+
+    SOIL_LOG_LEVEL=INFO          minimum level that is emitted
+    SOIL_LOG_SAMPLE_RATE=0.01    fraction of DEBUG/INFO records kept
+    SOIL_LOG_FORMAT=json         one JSON object per line, or "text"
+
+Warnings and errors are never sampled away, and neither are records logged
+with ``extra={'sample': False}``: the sample rate is meant for per-request
+records, not one-off ones like the startup report or a model reload. Fields
+passed as ``extra={'fields': {...}}`` become keys of the JSON object.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+
+class SampledFilter(logging.Filter):
+    """Keep a random ``rate`` fraction of records below ``WARNING`` unless they opt out."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return (record.levelno >= logging.WARNING or self.rate >= 1.0 or getattr(record, 'sample', True) is False
+                or random.random() < self.rate)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.{:03d}Z'.format(int(record.msecs)),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join('{}={}'.format(k, v) for k, v in fields.items())
+        return line
+
+
+def configure_logging(name='soil'):
+    """Set up and return the app logger from the SOIL_LOG_* environment variables."""
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if os.environ.get('SOIL_LOG_FORMAT', 'json') == 'json' else TextFormatter())
+    handler.addFilter(SampledFilter(float(os.environ.get('SOIL_LOG_SAMPLE_RATE', 0.01))))
+    logger.addHandler(handler)
+    logger.setLevel(os.environ.get('SOIL_LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
+    return logger
@@ -0,0 +1,189 @@
+"""Counters, gauges and histograms rendered in the Prometheus text format.
+
+Only what the app needs of the format is implemented, so there is no
+client library to install. Values live in the process that recorded them:
+under gunicorn every worker serves its own numbers on /metrics, and a
+scrape reaches whichever worker accepts the connection.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join('{}="{}"'.format(k, v) for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return ['{}{} {}'.format(self.name, _format_labels(self.labelnames, key), _format_value(v))
+                for key, v in values]
+
+
+class Gauge(_Metric):
+    """A value read from ``fn()`` at scrape time (e.g. a queue depth)."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def _samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        return ['{} {}'.format(self.name, _format_value(value))]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Per-bucket counts, then the sum; made cumulative when rendered
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        lines = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append('{}_bucket{} {}'.format(self.name, labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            lines.append('{}_sum{} {}'.format(self.name, labels, _format_value(counts[-1])))
+            lines.append('{}_count{} {}'.format(self.name, labels, cumulative))
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, fn):
+        return self.register(Gauge(name, help, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def instrument_app(app, registry):
+    """Count requests and observe their latency per route template, method and status."""
+    from flask import g, request
+
+    requests_total = registry.counter('http_requests_total', "HTTP requests handled",
+                                      ('route', 'method', 'status'))
+    latency = registry.histogram('http_request_duration_seconds', "HTTP request latency",
+                                 ('route', 'method'))
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            latency.observe(time.perf_counter() - started, route=route, method=request.method)
+            requests_total.inc(route=route, method=request.method, status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def _record_failure(exc):
+        # after_request is skipped when a view raises; count those as 500s
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            latency.observe(time.perf_counter() - started, route=route, method=request.method)
+            requests_total.inc(route=route, method=request.method, status=500)
+
+    return requests_total, latency
@@ -0,0 +1,236 @@
+"""Nearest-neighbour index over historical soil samples ("similar fields").
+
+    python neighbors.py build [--data dataset.csv] [--from-db] [--out neighbors_index]
+
+The index directory holds standardized float32 features and int16 label
+codes as .npy files, which are memory-mapped when the index is opened, and
+a KD-tree is built over them. Rows added at runtime go to a small in-memory
+delta that is searched by brute force and merged into the tree by
+``compact()``. The web workers open the index with ``persist=False`` and
+``max_delta``: they keep only their most recent additions in memory and
+never compact on a request thread. Rebuilding with --from-db is what brings
+logged predictions into the on-disk index.
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from columnar import ColumnarDataset, is_columnar
+from features import DATASET_DTYPES, FEATURE_COLUMNS, SOIL_CODES, encode_frame
+
+SOIL_NAMES = {code: name for name, code in SOIL_CODES.items()}
+
+
+class NeighbourIndex:
+    def __init__(self, features, label_codes, label_names, mean, std, path=None, compact_threshold=10000,
+                 persist=True, max_delta=None):
+        self.path = path
+        self.persist = persist
+        # With max_delta set the delta keeps that many of the latest rows and is never compacted
+        if max_delta is not None and max_delta < 0:
+            raise ValueError("max_delta must be zero or positive, got {}".format(max_delta))
+        self.max_delta = max_delta
+        self.dropped = 0
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.label_names = list(label_names)
+        self._label_lookup = {name: i for i, name in enumerate(self.label_names)}
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._base = features
+        self._base_labels = label_codes
+        self._tree = cKDTree(features, leafsize=32, balanced_tree=False) if len(features) else None
+        self._delta = np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float32)
+        self._delta_rows = []
+        self._delta_labels = []
+
+    @classmethod
+    def build(cls, matrix, labels, path=None, **kwargs):
+        """Build an index from an encoded feature matrix and its label strings."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        mean = matrix.mean(axis=0)
+        std = matrix.std(axis=0)
+        std[std == 0] = 1.0
+        label_names, codes = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+        index = cls((matrix - mean) / std, codes.astype(np.int16), label_names.tolist(), mean, std,
+                    path=path, **kwargs)
+        if path:
+            index.save(path)
+        return index
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        features = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+        label_codes = np.load(os.path.join(path, 'labels.npy'), mmap_mode='r')
+        return cls(features, label_codes, meta['labels'], meta['mean'], meta['std'], path=path, **kwargs)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        # Write next to the old files and swap in, so readers never see a partial file
+        for name, array in (('features.npy', self._base), ('labels.npy', self._base_labels)):
+            tmp = os.path.join(path, '{}.{}.tmp'.format(name, os.getpid()))
+            with open(tmp, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp, os.path.join(path, name))
+        # meta.json last: open() treats its presence as "the index is complete"
+        tmp = os.path.join(path, 'meta.json.{}.tmp'.format(os.getpid()))
+        with open(tmp, 'w') as f:
+            json.dump({'columns': FEATURE_COLUMNS, 'labels': self.label_names, 'count': int(len(self._base)),
+                       'mean': self.mean.tolist(), 'std': self.std.tolist()}, f)
+        os.replace(tmp, os.path.join(path, 'meta.json'))
+        self.path = path
+
+    def __len__(self):
+        return len(self._base) + len(self._delta_rows)
+
+    def add(self, row, label):
+        """Add one encoded feature row; it is searchable immediately."""
+        scaled = (np.asarray(row, dtype=np.float32) - self.mean) / self.std
+        with self._lock:
+            if self.max_delta == 0:
+                self.dropped += 1
+                return
+            if label not in self._label_lookup:
+                self._label_lookup[label] = len(self.label_names)
+                self.label_names.append(label)
+            self._delta_rows.append(scaled)
+            self._delta_labels.append(self._label_lookup[label])
+            self._delta = None
+            if self.max_delta is not None and len(self._delta_rows) > self.max_delta:
+                del self._delta_rows[0], self._delta_labels[0]
+                self.dropped += 1
+            pending = len(self._delta_rows)
+        if self.max_delta is None and pending >= self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        """Merge the runtime delta into the base arrays and rebuild the tree."""
+        with self._lock:
+            if not self._delta_rows:
+                return
+            base = np.concatenate([np.asarray(self._base), np.vstack(self._delta_rows)])
+            labels = np.concatenate([np.asarray(self._base_labels), np.array(self._delta_labels, dtype=np.int16)])
+            tree = cKDTree(base, leafsize=32, balanced_tree=False)
+            self._base, self._base_labels, self._tree = base, labels, tree
+            self._delta_rows, self._delta_labels = [], []
+            self._delta = np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float32)
+        if self.path and self.persist:
+            self.save(self.path)
+
+    def query(self, rows, k=5, exclude_exact=False):
+        """Return the ``k`` nearest samples for each encoded feature row.
+
+        Each result is a list of ``{"distance", "label", "features"}`` dicts
+        with features in original units, nearest first. ``exclude_exact``
+        leaves out samples identical to the row, e.g. the user's own earlier
+        submissions of the same values.
+        """
+        rows = np.atleast_2d(np.asarray(rows, dtype=np.float32))
+        scaled = (rows - self.mean) / self.std
+        with self._lock:
+            tree, base, base_labels = self._tree, self._base, self._base_labels
+            if self._delta is None:
+                self._delta = (np.vstack(self._delta_rows) if self._delta_rows
+                               else np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float32))
+            delta, delta_labels = self._delta, list(self._delta_labels)
+
+        candidates_d, candidates_i = [], []
+        if tree is not None:
+            extra = max(len(m) for m in tree.query_ball_point(scaled, 0)) if exclude_exact else 0
+            kk = min(k + extra, len(base))
+            dist, idx = tree.query(scaled, k=kk)
+            candidates_d.append(dist.reshape(len(rows), kk))
+            candidates_i.append(idx.reshape(len(rows), kk))
+        if len(delta):
+            dist = np.sqrt(((scaled[:, np.newaxis, :] - delta[np.newaxis]) ** 2).sum(axis=2))
+            candidates_d.append(dist)
+            candidates_i.append(np.arange(len(delta))[np.newaxis].repeat(len(rows), axis=0) + len(base))
+        if not candidates_d:
+            return [[] for _ in range(len(rows))]
+
+        dist = np.hstack(candidates_d)
+        idx = np.hstack(candidates_i)
+        if exclude_exact:
+            dist = np.where(dist <= 0, np.inf, dist)
+        order = np.argsort(dist, axis=1, kind='stable')[:, :k]
+        results = []
+        for r in range(len(rows)):
+            matches = []
+            for j in order[r]:
+                if not np.isfinite(dist[r, j]):
+                    break
+                i = int(idx[r, j])
+                if i < len(base):
+                    scaled_row, code = base[i], int(base_labels[i])
+                else:
+                    scaled_row, code = delta[i - len(base)], delta_labels[i - len(base)]
+                values = (np.asarray(scaled_row, dtype=np.float32) * self.std + self.mean).tolist()
+                sample = dict(zip(FEATURE_COLUMNS, values))
+                sample['soil'] = SOIL_NAMES.get(int(round(sample['soil'])), sample['soil'])
+                matches.append({'distance': float(dist[r, j]), 'label': self.label_names[code], 'features': sample})
+            results.append(matches)
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {'path': self.path, 'base_rows': int(len(self._base)), 'delta_rows': len(self._delta_rows),
+                    'max_delta': self.max_delta, 'dropped': self.dropped, 'labels': len(self.label_names)}
+
+
+def load_training_rows(path):
+    if is_columnar(path):
+        dataset = ColumnarDataset(path)
+        return dataset.features(), dataset.labels()
+    frame = pd.read_csv(path, dtype=DATASET_DTYPES, usecols=FEATURE_COLUMNS + ['label'])
+    matrix, row_ids, _ = encode_frame(frame)
+    return matrix, frame['label'].to_numpy()[row_ids].astype(str)
+
+
+def load_prediction_rows(pool, arraysize=5000):
+    """Stream the logged predictions out of the ``prediction`` table."""
+    query = ("SELECT N, P, K, temperature, humidity, ph, rainfall, soil, predicted_crop FROM prediction")
+    matrices, labels = [], []
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.arraysize = arraysize
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(arraysize)
+            if not rows:
+                break
+            frame = pd.DataFrame(rows, columns=FEATURE_COLUMNS + ['label'])
+            matrix, row_ids, _ = encode_frame(frame)
+            matrices.append(matrix)
+            labels.append(frame['label'].to_numpy()[row_ids].astype(str))
+    if not matrices:
+        return np.empty((0, len(FEATURE_COLUMNS))), np.empty(0, dtype=str)
+    return np.vstack(matrices), np.concatenate(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="build the index from dataset.csv and optionally the prediction table")
+    build.add_argument('--data', default='dataset.csv')
+    build.add_argument('--from-db', action='store_true', help="also index rows from the prediction table")
+    build.add_argument('--out', default='neighbors_index')
+    args = parser.parse_args()
+
+    matrix, labels = load_training_rows(args.data)
+    if args.from_db:
+        from db import create_pool
+        db_matrix, db_labels = load_prediction_rows(create_pool())
+        matrix, labels = np.vstack([matrix, db_matrix]), np.concatenate([labels, db_labels])
+    index = NeighbourIndex.build(matrix, labels, path=args.out)
+    print("Indexed {} rows into {}".format(len(index), args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+-- Columns and indexes behind GET /history and /history/export (see history.py).
+-- Run once against the Oracle schema that owns the prediction table. The SQLite
+-- stand-in (db.py) creates the same columns and indexes by itself.
+
+-- A stable newest-first order: created_at is when the prediction was made (UTC),
+-- recorded by the app and carried through the audit queue and its spill file,
+-- and id breaks ties between rows of the same batch. Rows that already exist
+-- get the time of this ALTER.
+ALTER TABLE prediction ADD (
+    id NUMBER GENERATED BY DEFAULT ON NULL AS IDENTITY,
+    created_at TIMESTAMP(3) DEFAULT SYS_EXTRACT_UTC(SYSTIMESTAMP) NOT NULL
+);
+ALTER TABLE prediction ADD CONSTRAINT prediction_pk PRIMARY KEY (id);
+
+-- One index range scan per page, read backwards from the cursor: the user's
+-- whole history, and the same filtered by crop or by soil. Date filters are
+-- ranges on created_at within each of them.
+CREATE INDEX prediction_name_created ON prediction (name, created_at, id);
+CREATE INDEX prediction_name_crop_created ON prediction (name, predicted_crop, created_at, id);
+CREATE INDEX prediction_name_soil_created ON prediction (name, soil, created_at, id);
+
+-- Fresh optimizer statistics so the new indexes are used straight away
+BEGIN
+    DBMS_STATS.GATHER_TABLE_STATS(ownname => USER, tabname => 'PREDICTION', cascade => TRUE);
+END;
+/
@@ -0,0 +1,32 @@
+-- Aggregate tables maintained by rollups.py and read by the /dashboard/* endpoints.
+-- Run once against the Oracle schema that owns the prediction table, after
+-- prediction_history.sql (the rollup is incremental on prediction.id). The
+-- SQLite stand-in (db.py) creates the same tables by itself.
+
+-- Set by the database on insert, unlike created_at which carries the prediction time; rollups.py
+-- only counts rows stored more than --settle seconds ago, so it never steps over a pending batch
+ALTER TABLE prediction ADD (inserted_at TIMESTAMP(3) DEFAULT SYS_EXTRACT_UTC(SYSTIMESTAMP) NOT NULL);
+
+-- One row per month, soil type and crop: counts plus feature sums, so means are sum / predictions
+CREATE TABLE crop_soil_monthly (
+    period VARCHAR2(7) NOT NULL,
+    soil VARCHAR2(20) NOT NULL,
+    predicted_crop VARCHAR2(50) NOT NULL,
+    predictions NUMBER NOT NULL,
+    sum_n NUMBER NOT NULL,
+    sum_p NUMBER NOT NULL,
+    sum_k NUMBER NOT NULL,
+    sum_temperature NUMBER NOT NULL,
+    sum_humidity NUMBER NOT NULL,
+    sum_ph NUMBER NOT NULL,
+    sum_rainfall NUMBER NOT NULL,
+    CONSTRAINT crop_soil_monthly_pk PRIMARY KEY (period, soil, predicted_crop)
+);
+
+-- Highest prediction.id already folded into each rollup
+CREATE TABLE rollup_state (
+    name VARCHAR2(50) PRIMARY KEY,
+    last_id NUMBER NOT NULL
+);
+INSERT INTO rollup_state (name, last_id) VALUES ('crop_soil_monthly', 0);
+COMMIT;
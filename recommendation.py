@@ -0,0 +1,120 @@
+import math
+import threading
+
+import numpy as np
+
+from cache import LRUCache
+from features import FEATURE_COLUMNS, model_input
+
+# Step each feature is rounded to before it becomes part of the cache key
+DEFAULT_QUANTIZATION = {
+    'N': 1, 'P': 1, 'K': 1,
+    'temperature': 0.1, 'humidity': 0.1, 'ph': 0.1, 'rainfall': 1,
+    'soil': 1,
+}
+
+
+def parse_quantization(spec):
+    """Parse ``"ph=0.05,rainfall=5"`` into a quantization dict over the defaults.
+
+    Raises ValueError for unknown features and for steps that are not
+    positive finite numbers (a zero step would divide the row by zero).
+    """
+    quantization = dict(DEFAULT_QUANTIZATION)
+    for part in filter(None, (p.strip() for p in (spec or '').split(','))):
+        name, _, step = part.partition('=')
+        if name not in quantization:
+            raise ValueError("Unknown feature in quantization spec: {}".format(name))
+        try:
+            quantization[name] = float(step)
+        except ValueError:
+            raise ValueError("Quantization step for {} is not a number: {!r}".format(name, step))
+        if not math.isfinite(quantization[name]) or quantization[name] <= 0:
+            raise ValueError("Quantization step for {} must be a positive number, got {}".format(name, step))
+    return quantization
+
+
+def top_k(model, matrix, k=3):
+    """Top-``k`` labels and scores for every row of ``matrix`` from one scoring pass.
+
+    Uses ``predict_proba`` with an argpartition per row, so only the k best of
+    the 22 crops are ever sorted. Models without probabilities get their
+    single prediction with a score of 1.0.
+    """
+    X = model_input(matrix, model)
+    if not hasattr(model, 'predict_proba'):
+        labels = np.asarray(model.predict(X))[:, np.newaxis]
+        return labels, np.ones(labels.shape)
+    proba = model.predict_proba(X)
+    k = max(1, min(k, proba.shape[1]))
+    idx = np.argpartition(proba, -k, axis=1)[:, -k:]
+    scores = np.take_along_axis(proba, idx, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    idx = np.take_along_axis(idx, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    return np.asarray(model.classes_)[idx], scores
+
+
+def rank_rows(model, matrix, k=3):
+    """``top_k`` as a list of ``[(crop, score), ...]`` rankings, one per row."""
+    labels, scores = top_k(model, matrix, k)
+    return [list(zip(row_labels, row_scores)) for row_labels, row_scores in zip(labels.tolist(), scores.tolist())]
+
+
+class RecommendationCache:
+    """LRU cache in front of the crop model keyed on quantized inputs.
+
+    The eight encoded features are rounded to their quantization step, and on
+    a miss the model ranks the rounded values, so every input that falls into
+    the same cell gets the same answer regardless of which one came first. The
+    cache remembers which model object filled it and clears itself as soon as
+    it is called with a different one (e.g. after crop.pkl is reloaded).
+    """
+
+    def __init__(self, quantization=None, maxsize=10000):
+        quantization = quantization or DEFAULT_QUANTIZATION
+        self.steps = np.array([float(quantization[c]) for c in FEATURE_COLUMNS])
+        self._cache = LRUCache(maxsize=maxsize)
+        self._model = None
+        self._lock = threading.Lock()
+        self.bypassed = 0
+        self.invalidations = 0
+
+    def _check_model(self, model):
+        if model is not self._model:
+            with self._lock:
+                if model is not self._model:
+                    if self._model is not None:
+                        self.invalidations += 1
+                    self._cache.clear()
+                    self._model = model
+
+    def rank(self, model, row, k=3, use_cache=True, ranker=rank_rows):
+        """Return the model's top-``k`` ``(crop, score)`` pairs for one encoded feature row.
+
+        ``ranker(model, matrix, k)`` computes misses; it defaults to
+        ``rank_rows`` and lets callers score somewhere other than in-process.
+        """
+        row = np.asarray(row, dtype=np.float64)
+        if not use_cache:
+            self.bypassed += 1
+            return ranker(model, row[np.newaxis], k)[0]
+
+        self._check_model(model)
+        cells = np.rint(row / self.steps)
+        key = (k,) + tuple(cells.astype(np.int64).tolist())
+        ranking = self._cache.get(key)
+        if ranking is None:
+            ranking = ranker(model, (cells * self.steps)[np.newaxis], k)[0]
+            self._cache.set(key, ranking)
+        return ranking
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats['bypassed'] = self.bypassed
+        stats['invalidations'] = self.invalidations
+        stats['quantization'] = dict(zip(FEATURE_COLUMNS, self.steps.tolist()))
+        return stats
@@ -0,0 +1,175 @@
+import os
+import pickle
+import resource
+import threading
+import time
+from collections import namedtuple
+
+from resources import timed_phase
+
+LoadedModel = namedtuple('LoadedModel', 'version path model loaded_at load_seconds disk_bytes rss_delta_mb')
+
+
+def numbered_versions(root, filename=None):
+    """Versions laid out as ``root/<n>`` (or ``root/<n>/filename``), like ./models/1."""
+    def discover():
+        found = []
+        if os.path.isdir(root):
+            for name in os.listdir(root):
+                if name.isdigit():
+                    path = os.path.join(root, name, filename) if filename else os.path.join(root, name)
+                    if os.path.exists(path):
+                        found.append((int(name), path))
+        return sorted(found)
+    return discover
+
+
+def file_versions(path):
+    """A single unversioned file (e.g. crop.pkl) whose modification time is its version."""
+    def discover():
+        if os.path.exists(path):
+            return [(int(os.path.getmtime(path)), path)]
+        return []
+    return discover
+
+
+def disk_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except OSError:
+        return 0.0
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of its exited children, in MB."""
+    # ru_maxrss is in KB on Linux; child processes are counted once they have exited
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024.0, children / 1024.0
+
+
+def load_crop_model(path):
+    """Loader for crop.pkl, shared by the web process, the inference workers and score_csv.py."""
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class ModelRegistry:
+    """Serve the newest version of a model and hot-swap it when a new one appears.
+
+    The first ``get()`` loads the newest version found by ``discover`` and
+    starts a watcher thread that polls every ``poll_interval`` seconds. A new
+    version is loaded and warmed up on that thread while requests keep using
+    the active one, then swapped in with a single reference assignment;
+    requests that already fetched the old model finish on it. A version that
+    fails to load is reported in ``stats()`` and retried on the next poll.
+    """
+
+    def __init__(self, name, discover, loader, warmup=None, poll_interval=30):
+        self.name = name
+        self.discover = discover
+        self.loader = loader
+        self.warmup = warmup
+        self.poll_interval = poll_interval
+        self._active = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self.swaps = 0
+        self.last_error = None
+
+    def get(self):
+        model = self.preload()
+        self._ensure_watcher()
+        return model
+
+    def preload(self):
+        """Load the newest version if nothing is active yet, without starting the watcher."""
+        active = self._active
+        if active is None:
+            with self._lock:
+                if self._active is None:
+                    with timed_phase(self.name):
+                        self._active = self._load(*self._newest())
+                active = self._active
+        return active.model
+
+    @property
+    def loaded(self):
+        return self._active is not None
+
+    def reset(self):
+        with self._lock:
+            self._active = None
+
+    def _newest(self):
+        versions = self.discover()
+        if not versions:
+            raise FileNotFoundError("No versions of {} found".format(self.name))
+        return versions[-1]
+
+    def _load(self, version, path):
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        model = self.loader(path)
+        if self.warmup is not None:
+            self.warmup(model)
+        return LoadedModel(version, path, model, time.time(), time.perf_counter() - started,
+                           disk_bytes(path), rss_mb() - rss_before)
+
+    def check(self):
+        """Load and swap in a newer version if there is one; returns True if swapped."""
+        with self._reload_lock:
+            active = self._active
+            version, path = self._newest()
+            if active is not None and (version, path) == (active.version, active.path):
+                return False
+            try:
+                loaded = self._load(version, path)
+            except Exception as exc:
+                self.last_error = "version {}: {!r}".format(version, exc)
+                raise
+            self._active = loaded
+            self.swaps += 1
+            self.last_error = None
+            return True
+
+    def _ensure_watcher(self):
+        # Started lazily so that each forked worker runs its own watcher
+        if not self.poll_interval or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        with self._lock:
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch, name=self.name + "-watcher", daemon=True)
+                self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.check()
+            except Exception:
+                pass  # kept in last_error; the active version keeps serving
+
+    def stats(self):
+        active = self._active
+        stats = {'name': self.name, 'loaded': active is not None, 'swaps': self.swaps,
+                 'poll_interval_s': self.poll_interval, 'last_error': self.last_error,
+                 'available_versions': [v for v, _ in self.discover()]}
+        if active is not None:
+            stats.update({
+                'active_version': active.version,
+                'path': active.path,
+                'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(active.loaded_at)),
+                'load_seconds': active.load_seconds,
+                'disk_bytes': active.disk_bytes,
+                'rss_delta_mb': active.rss_delta_mb,
+            })
+        return stats
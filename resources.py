@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Seconds spent in each startup phase of this process, in the order they ran
+STARTUP_PHASES = OrderedDict()
+
+
+def record_phase(name, seconds):
+    STARTUP_PHASES[name] = STARTUP_PHASES.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed_phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+
+def startup_report():
+    return {
+        'pid': os.getpid(),
+        'phases_ms': {name: seconds * 1000.0 for name, seconds in STARTUP_PHASES.items()},
+        'total_ms': sum(STARTUP_PHASES.values()) * 1000.0,
+    }
+
+
+class LazyResource:
+    """Build an expensive object (model, DB pool) on first use.
+
+    ``get()`` runs the factory once under a lock and records how long it took
+    as a startup phase. Attribute access is forwarded to the object, so a
+    ``LazyResource`` can stand in wherever the object itself was used.
+    ``reset()`` forgets the object, e.g. in a forked worker that must not
+    reuse the parent's database connections.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        value = self._value
+        if value is None:
+            with self._lock:
+                value = self._value
+                if value is None:
+                    with timed_phase(self.name):
+                        value = self._value = self._factory()
+        return value
+
+    @property
+    def loaded(self):
+        return self._value is not None
+
+    def reset(self):
+        with self._lock:
+            self._value = None
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
@@ -0,0 +1,168 @@
+"""Incremental monthly rollups of the ``prediction`` table for the dashboards.
+
+    python rollups.py refresh [--every 300] [--settle 60]
+    python rollups.py rebuild
+
+``crop_soil_monthly`` holds one row per (month, soil, crop): the number of
+predictions and the sum of every feature, so counts and feature means can be
+read without touching ``prediction``. ``refresh`` folds in only the rows
+added since the last run. The ``rollup_state`` watermark stores the highest
+prediction id already counted. Rows the database stored less than --settle
+seconds ago (``inserted_at``, set by the database itself) are left for the
+next run, so a lower-id batch the audit queue is still writing is not
+skipped over, even when rows replayed with an old ``created_at`` land after
+it. --settle should exceed the longest an insert can stay uncommitted.
+Months come from ``created_at``, the UTC time the prediction was made, so
+rows replayed late from the spill file still land in their own month. Each
+refresh runs in one transaction. It claims its id range by moving the
+watermark forward only if nobody else moved it first, so overlapping runs
+(cron plus a manual run, or several hosts) cannot count a row twice. ``rebuild`` empties the rollup and recounts everything, e.g.
+after rows were backfilled.
+
+The tables are created by prediction_rollups.sql on Oracle and by db.py for
+the SQLite stand-in. The dashboard endpoints read them through
+``load_views``.
+"""
+import argparse
+import time
+
+from db import create_pool
+
+ROLLUP = 'crop_soil_monthly'
+SUM_COLUMNS = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+_COUNTS = ['predictions'] + ['sum_' + c.lower() for c in SUM_COLUMNS]
+_ALL = ['period', 'soil', 'predicted_crop'] + _COUNTS
+_UPSERT_SET = ', '.join('{0} = {0} + excluded.{0}'.format(c) for c in _COUNTS)
+_MERGE_SET = ', '.join('r.{0} = r.{0} + d.{0}'.format(c) for c in _COUNTS)
+
+# The few statements that differ between Oracle and the SQLite stand-in
+DIALECTS = {
+    'oracle': {
+        'period': "TO_CHAR(created_at, 'YYYY-MM')",
+        'cutoff': "SYS_EXTRACT_UTC(SYSTIMESTAMP) - NUMTODSINTERVAL(:2, 'SECOND')",
+        'upsert': ("MERGE INTO crop_soil_monthly r USING (SELECT {using} FROM dual) d "
+                   "ON (r.period = d.period AND r.soil = d.soil AND r.predicted_crop = d.predicted_crop) "
+                   "WHEN MATCHED THEN UPDATE SET {set} "
+                   "WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({values})").format(
+            using=', '.join(':{} {}'.format(i + 1, c) for i, c in enumerate(_ALL)), set=_MERGE_SET,
+            columns=', '.join(_ALL), values=', '.join('d.' + c for c in _ALL)),
+    },
+    'sqlite': {
+        'period': "substr(created_at, 1, 7)",
+        'cutoff': "strftime('%Y-%m-%d %H:%M:%f', 'now', '-' || :2 || ' seconds')",
+        'upsert': ("INSERT INTO crop_soil_monthly ({columns}) VALUES ({values}) "
+                   "ON CONFLICT (period, soil, predicted_crop) DO UPDATE SET {set}").format(
+            columns=', '.join(_ALL), values=', '.join(':{}'.format(i + 1) for i in range(len(_ALL))),
+            set=_UPSERT_SET),
+    },
+}
+
+
+def refresh(pool, settle_seconds=60):
+    """Fold predictions added since the last refresh into the rollup; returns how many were added."""
+    sql = DIALECTS[pool.dialect]
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT last_id FROM rollup_state WHERE name = :1", (ROLLUP,))
+        last_id = cursor.fetchone()[0]
+        cursor.execute("SELECT MAX(id) FROM prediction WHERE id > :1 AND inserted_at <= " + sql['cutoff'],
+                       (last_id, settle_seconds))
+        upper = cursor.fetchone()[0]
+        if upper is None:
+            return 0
+
+        # Claim (last_id, upper]; a concurrent refresh that read the same last_id updates nothing
+        cursor.execute("UPDATE rollup_state SET last_id = :1 WHERE name = :2 AND last_id = :3",
+                       (upper, ROLLUP, last_id))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return 0
+        cursor.execute(
+            "SELECT {period}, soil, predicted_crop, COUNT(*), {sums} FROM prediction "
+            "WHERE id > :1 AND id <= :2 AND soil IS NOT NULL AND predicted_crop IS NOT NULL "
+            "GROUP BY {period}, soil, predicted_crop".format(
+                period=sql['period'], sums=', '.join('SUM({})'.format(c) for c in SUM_COLUMNS)),
+            (last_id, upper))
+        groups = cursor.fetchall()
+        if groups:
+            cursor.executemany(sql['upsert'], groups)
+        conn.commit()
+    return sum(group[3] for group in groups)
+
+
+def rebuild(pool, settle_seconds=60):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM crop_soil_monthly")
+        cursor.execute("UPDATE rollup_state SET last_id = 0 WHERE name = :1", (ROLLUP,))
+        conn.commit()
+    return refresh(pool, settle_seconds)
+
+
+def load_views(pool):
+    """The dashboard views computed from the rollup table (a few hundred rows at most).
+
+    ``crops_by_soil`` counts crops per soil type, ``monthly`` counts them per
+    month, and ``feature_means`` averages the inputs per soil type and crop.
+    """
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT {} FROM crop_soil_monthly ORDER BY period, soil, predicted_crop".format(
+            ', '.join(_ALL)))
+        rows = cursor.fetchall()
+
+    by_soil, by_month, sums = {}, {}, {}
+    for period, soil, crop, count, *feature_sums in rows:
+        soil_view = by_soil.setdefault(soil, {'predictions': 0, 'crops': {}})
+        soil_view['predictions'] += count
+        soil_view['crops'][crop] = soil_view['crops'].get(crop, 0) + count
+
+        month_view = by_month.setdefault(period, {'period': period, 'predictions': 0, 'crops': {}, 'soils': {}})
+        month_view['predictions'] += count
+        month_view['crops'][crop] = month_view['crops'].get(crop, 0) + count
+        month_view['soils'][soil] = month_view['soils'].get(soil, 0) + count
+
+        totals = sums.setdefault((soil, crop), [0] + [0.0] * len(SUM_COLUMNS))
+        totals[0] += count
+        for i, value in enumerate(feature_sums):
+            totals[i + 1] += value
+
+    means = {}
+    for (soil, crop), (count, *feature_sums) in sums.items():
+        means.setdefault(soil, {})[crop] = dict(
+            {'predictions': count}, **{c: total / count for c, total in zip(SUM_COLUMNS, feature_sums)})
+    return {
+        'crops_by_soil': {'soils': by_soil},
+        'monthly': {'months': list(by_month.values())},
+        'feature_means': {'soils': means},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    ref = sub.add_parser('refresh', help="fold new predictions into the rollup")
+    ref.add_argument('--every', type=float, default=0, help="keep refreshing every N seconds")
+    ref.add_argument('--settle', type=float, default=60, help="skip rows younger than this many seconds")
+    reb = sub.add_parser('rebuild', help="recount the rollup from the whole prediction table")
+    reb.add_argument('--settle', type=float, default=60)
+    args = parser.parse_args()
+
+    pool = create_pool()
+    if args.command == 'rebuild':
+        started = time.perf_counter()
+        added = rebuild(pool, args.settle)
+        print("Rebuilt {} from {} predictions in {:.2f}s".format(ROLLUP, added, time.perf_counter() - started))
+        return
+    while True:
+        started = time.perf_counter()
+        added = refresh(pool, args.settle)
+        print("Added {} predictions to {} in {:.3f}s".format(added, ROLLUP, time.perf_counter() - started),
+              flush=True)
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
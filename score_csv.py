@@ -0,0 +1,172 @@
+"""Score a soil-survey CSV of any size with the crop model, chunk by chunk.
+
+    python score_csv.py survey.csv.gz scored.csv.gz [--model crop.pkl] [--chunksize 50000]
+                        [--jobs 4] [--top-k 3] [--id-column sample_id]
+
+The input is laid out like dataset.csv (N, P, K, temperature, humidity, ph,
+rainfall, soil; any other columns are ignored) and may be gzip'd. It is
+read in --chunksize rows at a time. Each chunk is validated and
+soil-encoded like /predict (``encode_frame``) and ranked by the crop model
+in one of --jobs worker processes. Results are written in input order as
+soon as the chunks before them are done. At most two chunks per worker are
+in flight, so memory stays flat however large the file is.
+
+Each output row has the input's 0-based ``row`` number, the ``--id-column``
+value when given, the best ``crop`` and its ``score``, then
+``crop_2``/``score_2`` and so on up to --top-k. Rows that fail validation
+get an empty crop and the reason in ``error``.
+"""
+import argparse
+import gzip
+import multiprocessing as mp
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_COLUMNS, encode_frame
+from recommendation import top_k
+from registry import load_crop_model, numbered_versions, peak_rss_mb
+
+_MODEL = None
+
+
+def default_model_path():
+    # Same lookup as the server: the newest ./crop_models/<n>/crop.pkl, else crop.pkl
+    versions = numbered_versions(os.environ.get('SOIL_CROP_MODEL_DIR', './crop_models'), 'crop.pkl')()
+    return versions[-1][1] if versions else 'crop.pkl'
+
+
+def load_model(path):
+    global _MODEL
+    _MODEL = load_crop_model(path)
+
+
+def output_columns(k, id_column=None):
+    columns = ['row'] + ([id_column] if id_column else []) + ['crop', 'score']
+    for i in range(2, k + 1):
+        columns += ['crop_{}'.format(i), 'score_{}'.format(i)]
+    return columns + ['error']
+
+
+def score_chunk(start, chunk, k, id_column=None):
+    """Encode and rank one chunk; returns ``(csv_text, rows, valid_rows)``.
+
+    ``start`` is the chunk's first row number in the input file.
+    """
+    matrix, row_ids, errors = encode_frame(chunk)
+    n_rows = len(chunk)
+    out = {'row': np.arange(start, start + n_rows)}
+    if id_column:
+        out[id_column] = chunk[id_column].to_numpy() if id_column in chunk else np.full(n_rows, None)
+
+    ranked = np.full((n_rows, k), None, dtype=object)
+    scores = np.full((n_rows, k), np.nan)
+    if len(row_ids):
+        crops, crop_scores = top_k(_MODEL, matrix, k)
+        ranked[row_ids, :crops.shape[1]] = crops
+        scores[row_ids, :crop_scores.shape[1]] = crop_scores
+    for i in range(k):
+        suffix = '_{}'.format(i + 1) if i else ''
+        out['crop' + suffix] = ranked[:, i]
+        out['score' + suffix] = np.round(scores[:, i], 6)
+
+    error = np.full(n_rows, None, dtype=object)
+    for e in errors:
+        error[e['row']] = e['error']
+    out['error'] = error
+    frame = pd.DataFrame(out, columns=output_columns(k, id_column))
+    return frame.to_csv(header=False, index=False), n_rows, len(row_ids)
+
+
+def read_chunks(path, chunksize, id_column=None):
+    wanted = set(FEATURE_COLUMNS) | ({id_column} if id_column else set())
+    # Numeric columns are not forced to a dtype: text, blank and inf cells reach encode_frame,
+    # which reports them as row errors instead of failing the chunk
+    reader = pd.read_csv(path, usecols=lambda c: c in wanted, dtype={'soil': str}, chunksize=chunksize)
+    start = 0
+    for chunk in reader:
+        yield start, chunk
+        start += len(chunk)
+
+
+def open_output(path):
+    if path == '-':
+        return sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', newline='')
+    return open(path, 'w', newline='')
+
+
+def score_file(in_path, out_path, model_path, chunksize=50000, jobs=1, k=3, id_column=None, progress=None):
+    """Stream ``in_path`` through the crop model into ``out_path``; returns summary counts."""
+    rows = valid = 0
+    started = time.perf_counter()
+    last_report = started
+    out = open_output(out_path)
+    pool = None
+    try:
+        out.write(','.join(output_columns(k, id_column)) + '\n')
+        chunks = read_chunks(in_path, chunksize, id_column)
+        if jobs <= 1:
+            load_model(model_path)
+            results = (score_chunk(start, chunk, k, id_column) for start, chunk in chunks)
+        else:
+            pool = mp.get_context('spawn').Pool(jobs, initializer=load_model, initargs=(model_path,))
+            results = _ordered(pool, chunks, 2 * jobs, k, id_column)
+        for text, n_rows, n_valid in results:
+            out.write(text)
+            rows += n_rows
+            valid += n_valid
+            now = time.perf_counter()
+            if progress and now - last_report >= progress:
+                last_report = now
+                print("{} rows, {:.0f} rows/s".format(rows, rows / (now - started)), file=sys.stderr)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if out is not sys.stdout:
+            out.close()
+    seconds = time.perf_counter() - started
+    return {'rows': rows, 'valid': valid, 'invalid': rows - valid, 'seconds': seconds,
+            'rows_per_s': rows / seconds if seconds else float('inf')}
+
+
+def _ordered(pool, chunks, window, k, id_column):
+    # Like imap, but never reads more than ``window`` chunks ahead of the writer
+    pending = deque()
+    for start, chunk in chunks:
+        pending.append(pool.apply_async(score_chunk, (start, chunk, k, id_column)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="CSV laid out like dataset.csv (.gz is decompressed)")
+    parser.add_argument('output', help="result CSV ('-' for stdout, .gz is compressed)")
+    parser.add_argument('--model', default=None, help="crop model pickle (default: as the server picks it)")
+    parser.add_argument('--chunksize', type=int, default=50000)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="scoring processes")
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--id-column', default=None, help="input column copied to the output")
+    parser.add_argument('--progress', type=float, default=10.0, help="seconds between progress lines (0: off)")
+    args = parser.parse_args()
+
+    summary = score_file(args.input, args.output, args.model or default_model_path(), args.chunksize,
+                         args.jobs, args.top_k, args.id_column, args.progress)
+    own, workers = peak_rss_mb()
+    memory = "peak RSS {:.0f} MB".format(own)
+    if args.jobs > 1:
+        memory += " (largest worker {:.0f} MB)".format(workers)
+    print("Scored {rows} rows ({valid} valid, {invalid} invalid) in {seconds:.1f}s, {rows_per_s:.0f} rows/s; "
+          "{memory}".format(memory=memory, **summary), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
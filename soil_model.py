@@ -0,0 +1,92 @@
+import os
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from imaging import IMAGE_SIZE
+
+
+class SoilClassifier:
+    """Keras soil model behind a traced, signature-pinned inference function.
+
+    ``Model.predict`` builds a data adapter, callbacks and a progress bar on
+    every call, which dominates latency for a handful of images. Here the
+    forward pass is traced once at load time for float32 ``[batch, 224, 224,
+    3]`` input and each call goes straight to the concrete graph function.
+    """
+
+    def __init__(self, model_dir="./models/1", warmup=True):
+        self.model_dir = model_dir
+        self.model = tf.keras.models.load_model(model_dir)
+        model = self.model
+
+        @tf.function(input_signature=[tf.TensorSpec([None, IMAGE_SIZE[0], IMAGE_SIZE[1], 3], tf.float32)])
+        def infer(images):
+            return model(images, training=False)
+
+        self._infer = infer.get_concrete_function()
+        if warmup:
+            self.warmup()
+
+    def warmup(self, batch_size=1):
+        self.predict(np.zeros((batch_size, IMAGE_SIZE[0], IMAGE_SIZE[1], 3), dtype=np.float32))
+
+    def predict(self, images):
+        images = tf.convert_to_tensor(images, dtype=tf.float32)
+        return self._infer(images).numpy()
+
+
+class TFLiteSoilClassifier:
+    """A TFLite export of the soil model (see soil_variants.py) behind the same interface.
+
+    Quantized inputs and outputs are converted from and to float32 here, so
+    callers keep passing normalized ``[batch, 224, 224, 3]`` images. The
+    interpreter is resized only when the batch size changes, and calls are
+    serialized because an interpreter must not be invoked concurrently.
+    """
+
+    def __init__(self, model_path, num_threads=None, warmup=True):
+        self.model_path = model_path
+        self._interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+        self._lock = threading.Lock()
+        if warmup:
+            self.warmup()
+
+    def warmup(self, batch_size=1):
+        self.predict(np.zeros((batch_size, IMAGE_SIZE[0], IMAGE_SIZE[1], 3), dtype=np.float32))
+
+    def predict(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        dtype = self._input['dtype']
+        if dtype != np.float32:
+            scale, zero_point = self._input['quantization']
+            info = np.iinfo(dtype)
+            images = np.clip(np.rint(images / scale + zero_point), info.min, info.max).astype(dtype)
+        with self._lock:
+            if len(images) != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input['index'], list(images.shape))
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(images)
+            self._interpreter.set_tensor(self._input['index'], images)
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output['index'])
+        if self._output['dtype'] != np.float32:
+            scale, zero_point = self._output['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def load_soil_classifier(path, warmup=True):
+    """Classifier for a model directory: TFLite when it holds model.tflite, Keras otherwise.
+
+    SOIL_TFLITE_THREADS sets the interpreter's thread count.
+    """
+    tflite_path = os.path.join(path, 'model.tflite')
+    if os.path.exists(tflite_path):
+        threads = int(os.environ.get('SOIL_TFLITE_THREADS', 0)) or None
+        return TFLiteSoilClassifier(tflite_path, num_threads=threads, warmup=warmup)
+    return SoilClassifier(path, warmup=warmup)
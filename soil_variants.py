@@ -0,0 +1,227 @@
+"""Export and compare cheaper variants of the soil image model for CPU serving.
+
+    python soil_variants.py export [--model ./models/1] [--quantize int8] [--resolution 160]
+                                   [--calibration-images DIR] [--name NAME]
+    python soil_variants.py evaluate --images DIR [--model ./models/1] [--variants int8,float16-160]
+                                     [--out soil_variants.json]
+
+``export`` writes ./models/variants/<name>/<version>/, which the server
+picks up with SOIL_MODEL_VARIANT=<name> and hot-reloads like ./models:
+
+* ``--resolution`` rebuilds the network for smaller square inputs with a
+  Resizing layer in front, so the variant still takes 224x224 images but
+  every convolution runs on fewer pixels. This needs a model whose layers do
+  not depend on the input size (global pooling rather than Flatten).
+* ``--quantize`` converts to TFLite: ``dynamic`` (int8 weights), ``float16``,
+  or ``int8`` (weights and activations, calibrated on --calibration-images).
+  Without it the variant stays a Keras SavedModel.
+
+``evaluate`` runs the original and every variant on a held-out image set.
+Images are laid out as <DIR>/<label>/*.jpg, with label names as in
+imaging.SOIL_LABELS; unlabelled images directly under DIR are used only for
+agreement. It reports accuracy, agreement with the original's top class,
+mean absolute probability drift, single-image p50/p99 latency, batch
+throughput, load time, resident memory and size on disk. Each model is
+measured in its own process.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+from imaging import IMAGE_EXTENSIONS, IMAGE_SIZE, SOIL_LABELS, read_file_as_image
+from registry import disk_bytes, rss_mb
+
+
+def list_images(folder):
+    """``[(path, label index or None)]`` for the images under ``folder``."""
+    found = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if os.path.isdir(path) and name in SOIL_LABELS:
+            found.extend((os.path.join(path, f), SOIL_LABELS.index(name)) for f in sorted(os.listdir(path))
+                         if f.lower().endswith(IMAGE_EXTENSIONS))
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            found.append((path, None))
+    return found
+
+
+def load_images(paths):
+    images = np.empty((len(paths), IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+    for i, path in enumerate(paths):
+        with open(path, 'rb') as f:
+            read_file_as_image(f.read(), out=images[i])
+    return images
+
+
+def reduce_resolution(model, resolution):
+    """``model`` retraced for ``resolution``-square inputs, fed 224x224 images resized in the graph."""
+    import tensorflow as tf
+
+    body = tf.keras.models.clone_model(model, input_tensors=tf.keras.Input((resolution, resolution, 3)))
+    try:
+        body.set_weights(model.get_weights())
+    except ValueError as exc:
+        raise SystemExit("The model has input-size dependent layers, --resolution is not possible: {}".format(exc))
+    inputs = tf.keras.Input((IMAGE_SIZE[1], IMAGE_SIZE[0], 3))
+    resized = tf.keras.layers.Resizing(resolution, resolution, interpolation='bilinear')(inputs)
+    return tf.keras.Model(inputs, body(resized))
+
+
+def export(model_dir, out_dir, quantize=None, resolution=None, calibration_images=None, calibration_count=200):
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_dir)
+    if resolution and resolution != IMAGE_SIZE[0]:
+        model = reduce_resolution(model, resolution)
+    os.makedirs(out_dir, exist_ok=True)
+
+    if not quantize:
+        model.save(out_dir)
+    else:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantize == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantize == 'int8':
+            if not calibration_images:
+                raise SystemExit("--quantize int8 needs --calibration-images")
+            paths = [path for path, _ in list_images(calibration_images)][:calibration_count]
+
+            def representative_dataset():
+                for path in paths:
+                    yield [load_images([path])]
+
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        with open(os.path.join(out_dir, 'model.tflite'), 'wb') as f:
+            f.write(converter.convert())
+
+    with open(os.path.join(out_dir, 'variant.json'), 'w') as f:
+        json.dump({'source': os.path.abspath(model_dir), 'quantize': quantize or 'none',
+                   'resolution': resolution or IMAGE_SIZE[0], 'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                  f, indent=2)
+
+
+def _measure(model_dir, images, runs, batch_size):
+    """Run in a fresh process: load ``model_dir`` and time it on ``images``."""
+    from soil_model import load_soil_classifier
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    classifier = load_soil_classifier(model_dir)
+    load_seconds = time.perf_counter() - started
+
+    probabilities = np.concatenate([classifier.predict(images[i:i + batch_size])
+                                    for i in range(0, len(images), batch_size)])
+    single = []
+    for i in range(runs):
+        started = time.perf_counter()
+        classifier.predict(images[i % len(images)][np.newaxis])
+        single.append(time.perf_counter() - started)
+    batch = np.resize(images, (batch_size,) + images.shape[1:])
+    started = time.perf_counter()
+    for _ in range(max(1, runs // batch_size)):
+        classifier.predict(batch)
+    throughput = max(1, runs // batch_size) * batch_size / (time.perf_counter() - started)
+
+    single = np.array(single) * 1000.0
+    return probabilities, {
+        'load_seconds': load_seconds,
+        'rss_mb': rss_mb() - rss_before,
+        'disk_mb': disk_bytes(model_dir) / 1e6,
+        'latency_ms_p50': float(np.percentile(single, 50)),
+        'latency_ms_p99': float(np.percentile(single, 99)),
+        'throughput_images_per_s': throughput,
+    }
+
+
+def evaluate(model_dir, variant_dirs, image_dir, runs=200, batch_size=32):
+    found = list_images(image_dir)
+    if not found:
+        raise SystemExit("No images found in {}".format(image_dir))
+    images = load_images([path for path, _ in found])
+    truth = np.array([-1 if label is None else label for _, label in found])
+    labelled = truth >= 0
+
+    reports = []
+    reference = None
+    ctx = mp.get_context('spawn')
+    for name, path in [('original', model_dir)] + list(variant_dirs.items()):
+        with ctx.Pool(1) as pool:
+            probabilities, report = pool.apply(_measure, (path, images, runs, batch_size))
+        predicted = probabilities.argmax(axis=1)
+        if reference is None:
+            reference = probabilities
+        report.update({
+            'name': name,
+            'path': path,
+            'accuracy': float((predicted[labelled] == truth[labelled]).mean()) if labelled.any() else None,
+            'agreement': float((predicted == reference.argmax(axis=1)).mean()),
+            'mean_abs_drift': float(np.abs(probabilities - reference).mean()),
+        })
+        reports.append(report)
+    return {'images': len(found), 'labelled': int(labelled.sum()), 'models': reports}
+
+
+def variant_dir(model_dir, name):
+    root, version = os.path.split(os.path.normpath(model_dir))
+    return os.path.join(root, 'variants', name, version)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    exp = sub.add_parser('export', help="write a quantized and/or reduced-resolution variant")
+    exp.add_argument('--model', default='./models/1')
+    exp.add_argument('--quantize', choices=['dynamic', 'float16', 'int8'], default=None)
+    exp.add_argument('--resolution', type=int, default=None, help="square input size the network runs at")
+    exp.add_argument('--calibration-images', default=None, help="image folder used to calibrate int8")
+    exp.add_argument('--name', default=None, help="variant name (default: <quantize>-<resolution>)")
+    ev = sub.add_parser('evaluate', help="compare variants with the original on held-out images")
+    ev.add_argument('--model', default='./models/1')
+    ev.add_argument('--images', required=True)
+    ev.add_argument('--variants', default=None, help="comma separated names (default: all exported)")
+    ev.add_argument('--runs', type=int, default=200)
+    ev.add_argument('--batch-size', type=int, default=32)
+    ev.add_argument('--out', default='soil_variants.json')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        if not args.quantize and not args.resolution:
+            raise SystemExit("Nothing to do: pass --quantize and/or --resolution")
+        name = args.name or '-'.join(str(p) for p in (args.quantize, args.resolution) if p)
+        out_dir = variant_dir(args.model, name)
+        started = time.perf_counter()
+        export(args.model, out_dir, args.quantize, args.resolution, args.calibration_images)
+        print("Exported {} in {:.1f}s ({:.1f} MB); serve it with SOIL_MODEL_VARIANT={}".format(
+            out_dir, time.perf_counter() - started, disk_bytes(out_dir) / 1e6, name))
+        return
+
+    if args.variants:
+        names = args.variants.split(',')
+    else:
+        root = os.path.dirname(variant_dir(args.model, ''))
+        names = sorted(os.listdir(root)) if os.path.isdir(root) else []
+    variant_dirs = {name: variant_dir(args.model, name) for name in names
+                    if os.path.isdir(variant_dir(args.model, name))}
+    results = evaluate(args.model, variant_dirs, args.images, args.runs, args.batch_size)
+
+    print("{} images ({} labelled)".format(results['images'], results['labelled']))
+    print("{:<16} {:>8} {:>9} {:>7} {:>8} {:>8} {:>10} {:>7} {:>7} {:>7}".format(
+        'model', 'accuracy', 'agreement', 'drift', 'p50 ms', 'p99 ms', 'images/s', 'load s', 'RSS MB', 'disk MB'))
+    for r in results['models']:
+        accuracy = '{:.4f}'.format(r['accuracy']) if r['accuracy'] is not None else '-'
+        print("{name:<16} {acc:>8} {agreement:>9.4f} {mean_abs_drift:>7.4f} {latency_ms_p50:>8.2f} "
+              "{latency_ms_p99:>8.2f} {throughput_images_per_s:>10.1f} {load_seconds:>7.2f} {rss_mb:>7.0f} "
+              "{disk_mb:>7.1f}".format(acc=accuracy, **r))
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("Report written to {}".format(args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import io
+import zipfile
+from concurrent.futures import Future
+
+import numpy as np
+from PIL import Image
+
+from bulk_images import classify_images, iter_zip
+from imaging import SOIL_LABELS
+
+
+class InlineExecutor:
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), (120, 80, 40)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def damaged_archive():
+    buffer = io.BytesIO()
+    good = png_bytes()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr('good.png', good)
+        archive.writestr('corrupt.png', good)
+        archive.writestr('encrypted.png', good)
+        archive.writestr('after.png', good)
+    data = bytearray(buffer.getvalue())
+    # Flip a byte inside the stored data of the second member so its CRC no longer matches
+    data[data.index(good, data.index(b'corrupt.png')) + len(good) // 2] ^= 0xFF
+    # Mark the third member as encrypted in its local and central directory headers
+    local = data.index(b'encrypted.png') - 30
+    central = data.index(b'encrypted.png', local + 30 + len(good)) - 46
+    data[local + 6] |= 0x1
+    data[central + 8] |= 0x1
+    return zipfile.ZipFile(io.BytesIO(bytes(data)))
+
+
+def test_unreadable_zip_members_become_per_file_errors():
+    def predict(images):
+        return np.tile(np.eye(len(SOIL_LABELS), dtype=np.float32)[0], (len(images), 1))
+
+    with damaged_archive() as archive:
+        results = list(classify_images(iter_zip(archive), predict, InlineExecutor(), batch_size=2))
+    assert [r['file'] for r in results] == ['good.png', 'corrupt.png', 'encrypted.png', 'after.png']
+    assert 'class' in results[0] and 'class' in results[3]
+    assert results[1]['error'].startswith('could not read file')
+    assert results[2]['error'].startswith('could not read file')
@@ -0,0 +1,14 @@
+from cache import LRUCache
+
+
+def test_zero_ttl_disables_caching():
+    cache = LRUCache(maxsize=1, ttl=0)
+    cache.set('views', 1)
+    assert cache.get('views') is None
+    assert len(cache) == 0
+
+
+def test_no_ttl_never_expires():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
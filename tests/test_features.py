@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import FEATURE_COLUMNS, FeatureEncoder, InvalidFeatures, encode_frame, encode_record_frame
+
+SAMPLE = {'N': 90, 'P': 42, 'K': 43, 'temperature': 20.8, 'humidity': 82.0, 'ph': 6.5, 'rainfall': 202.9,
+          'soil': 'Alluvial'}
+
+
+@pytest.mark.parametrize('value', ['90', ' 90 ', '9e1', 90.0, np.int64(90), '1_000', '', 'abc', 'inf', 'nan',
+                                   None, True, [90], '９０', '0x5a'])
+def test_both_encoders_agree_on_numbers(value):
+    record = dict(SAMPLE, N=value)
+    try:
+        FeatureEncoder().encode(record)
+        row_ok = True
+    except InvalidFeatures:
+        row_ok = False
+    for frame_ok in (len(encode_frame(pd.DataFrame([record], columns=FEATURE_COLUMNS))[1]) == 1,
+                     len(encode_record_frame([record])[1]) == 1):
+        assert frame_ok == row_ok
+
+
+def test_numeric_columns_skip_parsing():
+    frame = pd.DataFrame([SAMPLE] * 3).astype({'N': 'Int64', 'rainfall': 'float32'})
+    matrix, row_ids, errors = encode_frame(frame)
+    assert errors == [] and row_ids.tolist() == [0, 1, 2]
+    assert matrix[0, 0] == 90
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from neighbors import NeighbourIndex
+
+ROWS = np.array([[90, 42, 43, 20.8, 82, 6.5, 202, 0],
+                 [85, 58, 41, 21.7, 80, 7.0, 226, 1],
+                 [60, 55, 44, 23.0, 82, 7.8, 263, 2],
+                 [74, 35, 40, 26.4, 80, 6.9, 242, 3]], dtype=np.float32)
+LABELS = ['rice', 'rice', 'maize', 'jute']
+
+
+def test_zero_max_delta_keeps_queries_working():
+    index = NeighbourIndex.build(ROWS, LABELS, max_delta=0)
+    index.add(ROWS[0] + 1, 'rice')
+    assert len(index.query(ROWS[0], k=2)[0]) == 2
+    assert index.stats()['delta_rows'] == 0
+    assert index.stats()['dropped'] == 1
+
+
+def test_max_delta_keeps_latest_rows():
+    index = NeighbourIndex.build(ROWS, LABELS, max_delta=2)
+    for i in range(5):
+        index.add(ROWS[0] + i + 1, 'rice')
+    assert index.stats()['delta_rows'] == 2
+    assert index.stats()['dropped'] == 3
+
+
+def test_negative_max_delta_is_rejected():
+    with pytest.raises(ValueError):
+        NeighbourIndex.build(ROWS, LABELS, max_delta=-1)
+
+
+def test_exclude_exact_skips_identical_samples():
+    index = NeighbourIndex.build(ROWS, LABELS, max_delta=10)
+    index.add(ROWS[1], 'rice')
+    matches = index.query(ROWS[1], k=3, exclude_exact=True)[0]
+    assert len(matches) == 3
+    assert all(match['distance'] > 0 for match in matches)
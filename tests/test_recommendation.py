@@ -0,0 +1,16 @@
+import pytest
+
+from recommendation import parse_quantization
+
+
+def test_parse_quantization_overrides_defaults():
+    quantization = parse_quantization("ph=0.05, rainfall=5")
+    assert quantization['ph'] == 0.05
+    assert quantization['rainfall'] == 5
+    assert quantization['N'] == 1
+
+
+@pytest.mark.parametrize('spec', ["ph=0", "ph=-0.1", "ph=nan", "ph=inf", "ph=", "ph=abc", "colour=1"])
+def test_parse_quantization_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        parse_quantization(spec)
@@ -0,0 +1,44 @@
+import sqlite3
+
+import rollups
+from db import SqlitePool
+
+INSERT = ("INSERT INTO prediction (id, name, mobile_number, N, P, K, temperature, humidity, ph, rainfall, soil, "
+          "predicted_crop, created_at) VALUES (?, 'u', '1', 90, 42, 43, 20.8, 82, 6.5, 202, 'Alluvial soil', 'rice', ?)")
+
+
+def insert(pool, ids, created_at):
+    conn = sqlite3.connect(pool.path)
+    conn.executemany(INSERT, [(i, created_at) for i in ids])
+    conn.commit()
+    conn.close()
+
+
+def test_replayed_rows_do_not_skip_a_pending_batch(tmp_path):
+    pool = SqlitePool(str(tmp_path / 'soil.db'))
+    # Ids 1-3 belong to a batch that is not committed yet; rows replayed from the spill file
+    # get the higher ids 4-6 but carry the time they were predicted, long before the settle window
+    insert(pool, [4, 5, 6], '2025-01-15 08:00:00.000')
+    assert rollups.refresh(pool, settle_seconds=60) == 0
+
+    insert(pool, [1, 2, 3], '2026-03-01 12:00:00.000')
+    assert rollups.refresh(pool, settle_seconds=0) == 6
+    months = rollups.load_views(pool)['monthly']['months']
+    assert {m['period']: m['predictions'] for m in months} == {'2025-01': 3, '2026-03': 3}
+
+
+def test_migration_adds_inserted_at_and_keeps_ids(tmp_path):
+    path = str(tmp_path / 'soil.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE prediction (id INTEGER PRIMARY KEY, name, mobile_number, N, P, K, temperature, "
+                 "humidity, ph, rainfall, soil, predicted_crop, created_at TEXT NOT NULL)")
+    conn.execute("INSERT INTO prediction VALUES (7, 'u', '1', 1, 2, 3, 4, 5, 6, 7, 'Red soil', 'maize', "
+                 "'2025-02-01 00:00:00.000')")
+    conn.commit()
+    conn.close()
+
+    SqlitePool(path)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT id, created_at, inserted_at IS NOT NULL FROM prediction").fetchall() == [
+        (7, '2025-02-01 00:00:00.000', 1)]
+    conn.close()
@@ -0,0 +1,162 @@
+"""Train the crop recommendation model (crop.pkl) from dataset.csv.
+
+    python train.py [--data dataset.csv] [--output crop.pkl] [--jobs -1]
+
+Every candidate classifier is cross-validated in parallel, then refit on the
+full data and timed on single-row predictions, since /predict scores one
+sample at a time. The most accurate candidate within --max-latency-ms is
+pickled together with its feature schema and label mapping, and the full
+comparison is written next to it as JSON.
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from columnar import ColumnarDataset, is_columnar
+from features import DATASET_DTYPES, FEATURE_COLUMNS, SOIL_CODES, encode_frame
+
+
+def candidate_models(seed):
+    return {
+        'random_forest': RandomForestClassifier(n_estimators=100, random_state=seed, n_jobs=1),
+        'extra_trees': ExtraTreesClassifier(n_estimators=100, random_state=seed, n_jobs=1),
+        'decision_tree': DecisionTreeClassifier(random_state=seed),
+        'gaussian_nb': GaussianNB(),
+        'knn': make_pipeline(StandardScaler(), KNeighborsClassifier(n_neighbors=5)),
+        'logistic_regression': make_pipeline(StandardScaler(), LogisticRegression(max_iter=2000)),
+    }
+
+
+def load_dataset(path):
+    """Read a dataset.csv-style file and encode it exactly like /predict does.
+
+    Rows that fail the form's validation rules are dropped (and counted).
+    ``path`` may also be a directory written by ``columnar.py convert``.
+    """
+    if is_columnar(path):
+        dataset = ColumnarDataset(path)
+        return dataset.features(), dataset.labels(), 0
+    frame = pd.read_csv(path, dtype=DATASET_DTYPES, usecols=FEATURE_COLUMNS + ['label'])
+    matrix, row_ids, errors = encode_frame(frame)
+    labels = frame['label'].to_numpy()[row_ids].astype(str)
+    return matrix, labels, len(errors)
+
+
+def measure_latency(model, X, rows=200):
+    """Median single-row predict latency and batch throughput of a fitted model."""
+    single = []
+    for i in range(min(rows, len(X))):
+        started = time.perf_counter()
+        model.predict(X[i:i + 1])
+        single.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    model.predict(X)
+    batch = time.perf_counter() - started
+    return {
+        'row_latency_ms_p50': float(np.percentile(single, 50)) * 1000.0,
+        'row_latency_ms_p99': float(np.percentile(single, 99)) * 1000.0,
+        'batch_rows_per_s': len(X) / batch if batch else float('inf'),
+    }
+
+
+def evaluate(name, model, X, y, folds, seed):
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    started = time.perf_counter()
+    scores = cross_val_score(model, X, y, cv=cv, scoring='accuracy', n_jobs=1)
+    model.fit(X, y)
+    report = {
+        'name': name,
+        'cv_accuracy_mean': float(scores.mean()),
+        'cv_accuracy_std': float(scores.std()),
+        'train_seconds': time.perf_counter() - started,
+        'model_bytes': len(pickle.dumps(model)),
+    }
+    report.update(measure_latency(model, X))
+    return report, model
+
+
+def select(reports, max_latency_ms=None, tolerance=0.005):
+    """Pick the most accurate model, preferring the fastest among near-ties."""
+    eligible = [r for r in reports if max_latency_ms is None or r['row_latency_ms_p50'] <= max_latency_ms]
+    if not eligible:
+        raise SystemExit("No candidate meets --max-latency-ms {}".format(max_latency_ms))
+    best = max(r['cv_accuracy_mean'] for r in eligible)
+    near = [r for r in eligible if r['cv_accuracy_mean'] >= best - tolerance]
+    return min(near, key=lambda r: r['row_latency_ms_p50'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='dataset.csv')
+    parser.add_argument('--output', default='crop.pkl')
+    parser.add_argument('--report', default=None, help="JSON report path (default: <output>.json)")
+    parser.add_argument('--models', default=None, help="comma separated subset of candidates")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--jobs', type=int, default=-1, help="parallel candidate fits (-1 = all cores)")
+    parser.add_argument('--max-latency-ms', type=float, default=None)
+    parser.add_argument('--tolerance', type=float, default=0.005,
+                        help="accuracy difference treated as a tie (the faster model wins)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    X, y, dropped = load_dataset(args.data)
+    print("Loaded {} rows from {} ({} invalid rows dropped) in {:.2f}s".format(
+        len(X), args.data, dropped, time.perf_counter() - started))
+
+    candidates = candidate_models(args.seed)
+    if args.models:
+        candidates = {name: candidates[name] for name in args.models.split(',')}
+
+    results = Parallel(n_jobs=args.jobs)(
+        delayed(evaluate)(name, model, X, y, args.folds, args.seed) for name, model in candidates.items()
+    )
+    reports = [report for report, _ in results]
+    fitted = {report['name']: model for report, model in results}
+
+    print("{:<20} {:>9} {:>8} {:>12} {:>12} {:>10}".format(
+        'model', 'accuracy', 'std', 'row p50 ms', 'row p99 ms', 'size KB'))
+    for r in sorted(reports, key=lambda r: -r['cv_accuracy_mean']):
+        print("{name:<20} {cv_accuracy_mean:>9.4f} {cv_accuracy_std:>8.4f} {row_latency_ms_p50:>12.3f} "
+              "{row_latency_ms_p99:>12.3f} {kb:>10.1f}".format(kb=r['model_bytes'] / 1024.0, **r))
+
+    chosen = select(reports, args.max_latency_ms, args.tolerance)
+    model = fitted[chosen['name']]
+    # Carry the schema with the artifact so the serving side can check it
+    model.feature_schema_ = {'columns': FEATURE_COLUMNS, 'soil_codes': SOIL_CODES}
+    model.label_mapping_ = {i: label for i, label in enumerate(model.classes_.tolist())}
+
+    with open(args.output, 'wb') as f:
+        pickle.dump(model, f)
+    report_path = args.report or os.path.splitext(args.output)[0] + '.json'
+    with open(report_path, 'w') as f:
+        json.dump({
+            'data': args.data,
+            'rows': int(len(X)),
+            'dropped_rows': dropped,
+            'seed': args.seed,
+            'folds': args.folds,
+            'selected': chosen['name'],
+            'feature_schema': model.feature_schema_,
+            'labels': model.classes_.tolist(),
+            'candidates': reports,
+        }, f, indent=2)
+    print("Selected {} -> {} (report: {})".format(chosen['name'], args.output, report_path))
+
+
+if __name__ == '__main__':
+    main()